@@ -3,31 +3,284 @@ FastAPI Backend Server for IdentityLens Cloud Inference
 Handles Android app requests and proxies to Fal.ai/Replicate
 """
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Dict, Any
+from contextlib import asynccontextmanager, AsyncExitStack
+import asyncio
+import base64
+import hashlib
 import os
+import uuid
+import aioboto3
+import httpx
+import orjson
 import uvicorn
+from cachetools import TTLCache
 from flux_api_client import (
     FluxPuLIDClient,
     GenerationMode,
     InferenceResult,
-    ErrorCodes
+    ErrorCodes,
+    ERROR_MESSAGES
 )
+from image_utils import decode_image
 from refinement_processor import RefinementProcessor
-from validation_module import IdentityValidator, QualityMetrics, DataPurgeProtocol
+from validation_module import IdentityValidator, IdentityImageCache, QualityMetrics, DataPurgeProtocol
 from export_module import ImageExporter
 
+FAL_API_KEY = os.getenv("FAL_API_KEY", "")
+
+# Object storage for exported images (served from the in-process image store when unset)
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_URL_TTL = int(os.getenv("S3_URL_TTL", "900"))
+
+# In-process image store behind GET /api/image/{image_id}, bounded by total bytes.
+# Entries must outlive the response cache so cached image URLs stay valid.
+IMAGE_STORE_TTL = int(os.getenv("IMAGE_STORE_TTL", "900"))
+IMAGE_STORE_MB = int(os.getenv("IMAGE_STORE_MB", "256"))
+_image_store: TTLCache = TTLCache(
+    maxsize=IMAGE_STORE_MB * 1024 * 1024,
+    ttl=IMAGE_STORE_TTL,
+    getsizeof=lambda entry: len(entry[0])
+)
+_MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "heif": "image/heif",
+    "webp": "image/webp",
+    "png": "image/png"
+}
+
+# Completed responses for identical re-submissions (network retries, UI re-taps).
+# Keep S3_URL_TTL above the cache TTL so cached presigned URLs stay valid.
+RESPONSE_CACHE_TTL = 600
+_response_cache: TTLCache = TTLCache(maxsize=512, ttl=RESPONSE_CACHE_TTL)
+_inflight_locks: Dict[str, asyncio.Lock] = {}
+
 # Initialize processors
 flux_client = FluxPuLIDClient(api_key=FAL_API_KEY, provider="fal")
 refinement_processor = RefinementProcessor(upscale_factor=4, enable_upscale=True)
-identity_validator = IdentityValidator(model_name="ArcFace")
+identity_validator = IdentityValidator(model_name="ArcFace", preload=False)
+reference_images = IdentityImageCache(ttl=RESPONSE_CACHE_TTL)
 image_exporter = ImageExporter()
 
 
+
+class BatchCoalescer:
+    """
+    Coalesce concurrent generation requests into batched provider submissions
+    
+    Each caller enqueues its request and awaits a future; a background worker
+    collects up to max_batch requests (or waits at most max_wait seconds after
+    the first one) and submits them together via FluxPuLIDClient.generate_batch_async.
+    
+    The window adapts to traffic: when requests arrive further apart than
+    max_wait on average, nothing is likely to join, so the batch is sent
+    with whatever is already queued.
+    """
+    
+    def __init__(
+        self,
+        client: FluxPuLIDClient,
+        max_batch: int = 8,
+        max_wait: float = 0.05
+    ):
+        """
+        Args:
+            client: Inference client used for batched submissions
+            max_batch: Maximum requests per batch (larger batches risk cascaded timeouts)
+            max_wait: Maximum seconds to wait for a batch to fill
+        """
+        self.client = client
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.q: asyncio.Queue = asyncio.Queue()
+        self._worker_task: Optional[asyncio.Task] = None
+        self._dispatch_tasks: set = set()
+        
+        # EWMA of request inter-arrival time (seconds, capped at 1s)
+        self._arrival_gap = 1.0
+        self._last_arrival = 0.0
+    
+    def start(self):
+        """Launch the background batching worker"""
+        self._worker_task = asyncio.create_task(self._worker())
+    
+    async def stop(self):
+        """Stop the worker and wait for in-flight batches"""
+        if self._worker_task:
+            self._worker_task.cancel()
+            await asyncio.gather(self._worker_task, return_exceptions=True)
+        await asyncio.gather(*self._dispatch_tasks, return_exceptions=True)
+    
+    async def submit(self, **payload) -> InferenceResult:
+        """Enqueue a generate_with_retry request and wait for its result"""
+        loop = asyncio.get_running_loop()
+        
+        now = loop.time()
+        self._arrival_gap = 0.8 * self._arrival_gap + 0.2 * min(now - self._last_arrival, 1.0)
+        self._last_arrival = now
+        
+        future = loop.create_future()
+        await self.q.put((payload, future))
+        return await future
+    
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            batch = [await self.q.get()]
+            
+            # Sparse traffic: only take what is already queued
+            wait = self.max_wait if self._arrival_gap < self.max_wait else 0.0
+            close_at = loop.time() + wait
+            
+            while len(batch) < self.max_batch:
+                timeout = close_at - loop.time()
+                try:
+                    if timeout <= 0:
+                        item = self.q.get_nowait()
+                    else:
+                        item = await asyncio.wait_for(self.q.get(), timeout=timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                
+                batch.append(item)
+            
+            # Dispatch without blocking collection of the next batch
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatch_tasks.add(task)
+            task.add_done_callback(self._dispatch_tasks.discard)
+    
+    async def _dispatch(self, batch: list):
+        try:
+            results = await self.client.generate_batch_async(
+                [payload for payload, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+coalescer = BatchCoalescer(flux_client, max_batch=8, max_wait=0.05)
+
+# Shared async HTTP client (created in lifespan, keep-alive pooled)
+http_client: Optional[httpx.AsyncClient] = None
+
+# Shared S3 client (created in lifespan when S3_BUCKET is configured)
+s3_client = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown"""
+    global http_client, s3_client
+    
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=60,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    )
+    coalescer.start()
+    
+    # Face model weights load here rather than at import
+    await asyncio.to_thread(identity_validator.preload)
+    
+    async with AsyncExitStack() as stack:
+        if S3_BUCKET:
+            s3_client = await stack.enter_async_context(aioboto3.Session().client("s3"))
+        
+        yield
+    
+    await coalescer.stop()
+    await flux_client.aclose()
+    await http_client.aclose()
+
+
+class NumpyORJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also serializes NumPy scalars/arrays from CV metrics"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+
+
+app = FastAPI(
+    title="IdentityLens Cloud Inference",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=NumpyORJSONResponse
+)
+
+class CORSLite:
+    """
+    Minimal pure-ASGI CORS middleware
+    
+    Answers preflight requests directly and tags every other response
+    with the allowed origin, without materializing Request/Response objects.
+    """
+    
+    def __init__(self, app, origin: str):
+        self.app = app
+        self.origin = origin.encode()
+        self.preflight_headers = [
+            (b"access-control-allow-origin", self.origin),
+            (b"access-control-allow-methods", b"POST,GET"),
+            (b"access-control-allow-headers", b"content-type,authorization")
+        ]
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        if scope["method"] == "OPTIONS":
+            await send({
+                "type": "http.response.start",
+                "status": 204,
+                "headers": self.preflight_headers
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        async def send_wrap(message):
+            if message["type"] == "http.response.start":
+                # Copy: pre-built responses share their header list across requests
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"access-control-allow-origin", self.origin)
+                ]
+            await send(message)
+        
+        await self.app(scope, receive, send_wrap)
+
+
+app.add_middleware(
+    CORSLite,
+    origin=os.getenv("CORS_ORIGIN", "http://localhost:8000")
+)
+
+# Pre-serialized health payload (probes hit this at high frequency)
+_HEALTH = ORJSONResponse({
+    "status": "healthy",
+    "version": "1.0.0",
+    "provider": "fal.ai"
+})
+
+
 # Request/Response Models
 class GenerationRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", validate_assignment=False)
+    
     identity_packet: Dict[str, Any] = Field(..., description="Identity packet from Android")
     master_prompt: str = Field(..., description="Optimized Flux prompt")
     negative_prompt: str = Field(..., description="Negative prompt")
@@ -46,10 +299,15 @@ class GenerationRequest(BaseModel):
     # Export options
     export_format: str = Field(default="webp", description="Output format: jpeg, webp, heif")
     add_watermark: bool = Field(default=True, description="Add SynthID watermark")
+    respond_inline: bool = Field(default=False, description="Return image as base64 instead of a storage URL")
+    seed: int = Field(default=-1, description="Generation seed (-1 = random, never cached)")
 
 
 class GenerationResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True, populate_by_name=True)
+    
     success: bool
+    image_id: Optional[str] = None
     image_url: Optional[str] = None
     image_base64: Optional[str] = None
     inference_time: float
@@ -68,10 +326,180 @@ class GenerationResponse(BaseModel):
     error: Optional[Dict[str, Any]] = None
 
 
+# Pre-built failure responses for provider errors with fixed messages
+# (only inference_time varies per request)
+_ERROR_RESPONSES = {
+    code: GenerationResponse(
+        success=False,
+        inference_time=0.0,
+        model_version="",
+        error={
+            "code": code,
+            "message": info["tr"],
+            "action": info["action"],
+            "retry": info["retry"]
+        }
+    )
+    for code, info in ERROR_MESSAGES.items()
+}
+
+
+# Endpoints
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return _HEALTH
+
+
 @app.post("/api/generate", response_model=GenerationResponse)
-async def generate_image(request: GenerationRequest):
+async def generate_image(
+    request: GenerationRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request
+):
     """
     Generate identity-preserved image with refinement and validation
+    
+    Receives:
+    - Identity packet (from Step 1: Image Capture)
+    - Master prompt (from Step 2: Prompt Engine)
+    - Negative prompt
+    - Generation mode
+    
+    Returns:
+    - Refined image (storage URL, /api/image URL or base64)
+    - Inference, refinement, validation and quality metadata
+    """
+    
+    response = await _generate_cached(request, background_tasks, http_request)
+    
+    # Already validated by construction; skip FastAPI's jsonable_encoder pass
+    return NumpyORJSONResponse(response.model_dump())
+
+
+@app.post("/api/batch-generate", response_model=list[GenerationResponse])
+async def batch_generate(
+    requests: list[GenerationRequest],
+    background_tasks: BackgroundTasks,
+    http_request: Request
+):
+    """
+    Generate multiple images
+    
+    Requests run concurrently; their Flux calls are coalesced into
+    batched submissions by the shared BatchCoalescer.
+    """
+    
+    responses = await asyncio.gather(*(
+        _generate_cached(request, background_tasks, http_request) for request in requests
+    ))
+    return NumpyORJSONResponse([response.model_dump() for response in responses])
+
+
+@app.get("/api/image/{image_id}", name="get_image")
+async def get_image(image_id: str):
+    """
+    Serve an exported image from the in-process image store
+    
+    Used when no S3 bucket is configured; image IDs are random and the
+    content never changes, so clients and CDNs may cache it.
+    """
+    
+    entry = _image_store.get(image_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Image not found or expired")
+    
+    image_bytes, media_type = entry
+    return Response(
+        content=image_bytes,
+        media_type=media_type,
+        headers={
+            "Cache-Control": f"public, max-age={IMAGE_STORE_TTL}, immutable",
+            "ETag": f'"{image_id}"'
+        }
+    )
+
+
+async def _generate_cached(
+    request: GenerationRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request
+) -> GenerationResponse:
+    """
+    Serve identical re-submissions from the response cache
+    
+    Concurrent duplicates are single-flighted: the first one runs the
+    pipeline while the others wait on the same per-key lock.
+    """
+    
+    key = _cache_key(request)
+    if key is None:
+        return await _run_generation(request, background_tasks, http_request)
+    
+    response = _cached_response(key)
+    if response is not None:
+        return response
+    
+    lock = _inflight_locks.setdefault(key, asyncio.Lock())
+    try:
+        async with lock:
+            response = _cached_response(key)
+            if response is None:
+                response = await _run_generation(request, background_tasks, http_request)
+                if response.success:
+                    _response_cache[key] = response
+    finally:
+        # Queued waiters keep their reference and re-check the cache once they acquire;
+        # a later arrival may already have registered a new lock under this key
+        if _inflight_locks.get(key) is lock:
+            del _inflight_locks[key]
+    
+    return response
+
+
+def _cached_response(key: str) -> Optional[GenerationResponse]:
+    """Cached response, or None if absent or its image-store entry was evicted"""
+    
+    response = _response_cache.get(key)
+    
+    # The image store is byte-bounded, so an image can go before its response
+    if response is not None and response.image_id is not None and response.image_id not in _image_store:
+        _response_cache.pop(key, None)
+        return None
+    
+    return response
+
+
+def _cache_key(request: GenerationRequest) -> Optional[str]:
+    """Content hash of face + face box + all generation options, or None if not cacheable"""
+    
+    # Random seeds are non-deterministic; unvalidated or inline results are not worth keeping
+    if request.seed < 0 or not request.enable_validation or request.respond_inline:
+        return None
+    
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(request.identity_packet.get("image", {}).get("cleanFace", "").encode())
+    # The face box steers validation (detector skip on the reference crop)
+    digest.update(orjson.dumps(
+        request.identity_packet.get("facialData", {}).get("boundingBox"),
+        option=orjson.OPT_SORT_KEYS
+    ))
+    digest.update(request.model_dump_json(exclude={"identity_packet"}).encode())
+    
+    return digest.hexdigest()
+
+
+async def _run_generation(
+    request: GenerationRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request
+) -> GenerationResponse:
+    """
+    Run the full pipeline for one request
+    (Flux generation, refinement, validation, quality metrics, export)
+    
+    The data purge does not affect the response, so it is scheduled on
+    background_tasks and runs after it is sent.
     """
     
     try:
@@ -83,41 +511,46 @@ async def generate_image(request: GenerationRequest):
         
         # Step 1: Generate with Flux + PuLID
         print("🎨 Step 1: Flux.1 + PuLID Generation...")
-        result: InferenceResult = flux_client.generate_with_retry(
+        result: InferenceResult = await coalescer.submit(
             identity_packet=request.identity_packet,
             master_prompt=request.master_prompt,
             negative_prompt=request.negative_prompt,
             mode=mode,
-            max_retries=3
+            max_retries=3,
+            seed=request.seed
         )
         
         if not result.success:
+            template = _ERROR_RESPONSES.get(result.error_code)
+            if template is not None and template.error["message"] == result.error_message:
+                return template.model_copy(update={"inference_time": result.inference_time})
+            
             return GenerationResponse(
                 success=False,
                 inference_time=result.inference_time,
                 model_version="",
                 error={
                     "code": result.error_code,
-                    "message": result.error_message
+                    "message": result.error_message,
+                    "action": _get_error_action(result.error_code),
+                    "retry": _is_retryable(result.error_code)
                 }
             )
         
-        # Load generated image
-        import requests
-        import cv2
-        import numpy as np
-        
-        img_response = requests.get(result.image_url)
-        img_array = np.asarray(bytearray(img_response.content), dtype=np.uint8)
-        flux_output = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        flux_output = cv2.cvtColor(flux_output, cv2.COLOR_BGR2RGB)
+        # Load generated image (reuse inline bytes when the provider returned them)
+        if result.image_base64:
+            image_data = base64.b64decode(result.image_base64)
+        else:
+            img_response = await http_client.get(result.image_url)
+            img_response.raise_for_status()
+            image_data = img_response.content
+        flux_output = await asyncio.to_thread(decode_image, image_data)
         
-        # Load reference image
-        ref_b64 = request.identity_packet["image"]["cleanFace"]
-        ref_data = base64.b64decode(ref_b64)
-        ref_array = np.frombuffer(ref_data, dtype=np.uint8)
-        reference_image = cv2.imdecode(ref_array, cv2.IMREAD_COLOR)
-        reference_image = cv2.cvtColor(reference_image, cv2.COLOR_BGR2RGB)
+        # Load reference image (decoded once per capture)
+        reference_image = await asyncio.to_thread(
+            reference_images.get,
+            request.identity_packet["image"]["cleanFace"]
+        )
         
         # Step 2: Refinement (optional)
         refined_image = flux_output
@@ -125,7 +558,8 @@ async def generate_image(request: GenerationRequest):
         
         if request.enable_refinement:
             print("✨ Step 2: Post-Processing Refinement...")
-            refined_image, refinement_metrics = refinement_processor.process(
+            refined_image, refinement_metrics = await asyncio.to_thread(
+                refinement_processor.process,
                 flux_output=flux_output,
                 reference_image=reference_image,
                 prompt=request.master_prompt,
@@ -137,9 +571,11 @@ async def generate_image(request: GenerationRequest):
         
         if request.enable_validation:
             print("🔍 Step 3: Identity Validation...")
-            is_valid, validation_results = identity_validator.validate(
+            is_valid, validation_results = await asyncio.to_thread(
+                identity_validator.validate,
                 reference_image=reference_image,
-                generated_image=refined_image
+                generated_image=refined_image,
+                reference_box=request.identity_packet.get("facialData", {}).get("boundingBox")
             )
             
             if not is_valid:
@@ -147,7 +583,7 @@ async def generate_image(request: GenerationRequest):
         
         # Step 4: Quality Metrics
         print("📊 Step 4: Quality Analysis...")
-        quality_metrics = QualityMetrics.calculate_all(refined_image)
+        quality_metrics = await asyncio.to_thread(QualityMetrics.calculate_all, refined_image)
         
         # Step 5: Export
         print("📤 Step 5: Export...")
@@ -157,28 +593,51 @@ async def generate_image(request: GenerationRequest):
             "processing_time": result.inference_time + (refinement_metrics.get("processing_time", 0) if refinement_metrics else 0)
         }
         
-        image_bytes, filename = image_exporter.export(
+        upload = s3_client is not None and not request.respond_inline
+        
+        image_bytes, filename = await asyncio.to_thread(
+            image_exporter.export,
             image=refined_image,
             output_format=request.export_format,
             quality=95,
             add_watermark=request.add_watermark,
-            metadata=export_metadata
+            metadata=export_metadata  # AI-provenance EXIF before the image leaves the server
         )
         
-        # Upload to storage (or return base64)
-        import base64
-        image_base64 = base64.b64encode(image_bytes).decode()
+        # Upload to storage, keep in the image store, or return base64
+        image_id = None
+        image_url = None
+        image_base64 = None
+        
+        if upload:
+            # Export filenames only have second resolution; prefix to keep keys unique
+            key = f"{uuid.uuid4().hex}/{filename}"
+            image_url = await _upload_image(image_bytes, key, request.export_format)
+        elif not request.respond_inline:
+            # Raw bytes via GET /api/image/{id} - no base64 inflation in the JSON
+            image_id = uuid.uuid4().hex
+            _image_store[image_id] = (
+                image_bytes,
+                _MEDIA_TYPES.get(request.export_format, "application/octet-stream")
+            )
+            image_url = str(http_request.url_for("get_image", image_id=image_id))
+        else:
+            image_base64 = base64.b64encode(image_bytes).decode()
         
-        # Step 6: Data Purge (privacy)
-        identity_id = request.identity_packet.get("captureId", "unknown")
-        temp_dir = "/tmp/identitylens"
-        DataPurgeProtocol.purge_embeddings(temp_dir, identity_id)
+        # Step 6: Data Purge (privacy) - after the response is sent.
+        # Without a captureId there is no session-specific file to remove
+        # (a shared placeholder id would hit other sessions' data)
+        identity_id = request.identity_packet.get("captureId")
+        if identity_id:
+            temp_dir = "/tmp/identitylens"
+            background_tasks.add_task(DataPurgeProtocol.purge_embeddings, temp_dir, identity_id)
         
         # Response
         return GenerationResponse(
             success=True,
-            image_url=result.image_url,  # Original Flux output
-            image_base64=image_base64,  # Refined output
+            image_id=image_id,  # Refined output (image store ID)
+            image_url=image_url,  # Refined output (presigned storage or /api/image URL)
+            image_base64=image_base64,  # Refined output (inline mode)
             inference_time=result.inference_time,
             model_version=result.model_version,
             seed=result.seed,
@@ -187,102 +646,6 @@ async def generate_image(request: GenerationRequest):
             quality_metrics=quality_metrics
         )
     
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "code": ErrorCodes.API_ERROR,
-                "message": str(e)
-            }
-        )
-
-
-import base64
-
-
-class GenerationResponse(BaseModel):
-    success: bool
-    image_url: Optional[str] = None
-    image_base64: Optional[str] = None
-    inference_time: float
-    model_version: str
-    seed: int = -1
-    error: Optional[Dict[str, Any]] = None
-
-
-class HealthResponse(BaseModel):
-    status: str
-    version: str
-    provider: str
-
-
-# Endpoints
-@app.get("/health", response_model=HealthResponse)
-async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "version": "1.0.0",
-        "provider": "fal.ai"
-    }
-
-
-@app.post("/api/generate", response_model=GenerationResponse)
-async def generate_image(request: GenerationRequest):
-    """
-    Generate identity-preserved image
-    
-    Receives:
-    - Identity packet (from Step 1: Image Capture)
-    - Master prompt (from Step 2: Prompt Engine)
-    - Negative prompt
-    - Generation mode
-    
-    Returns:
-    - Generated image URL
-    - Inference metadata
-    """
-    
-    try:
-        # Convert mode string to enum
-        mode = (
-            GenerationMode.SPEED if request.mode == "speed"
-            else GenerationMode.QUALITY
-        )
-        
-        # Generate with retry
-        result: InferenceResult = flux_client.generate_with_retry(
-            identity_packet=request.identity_packet,
-            master_prompt=request.master_prompt,
-            negative_prompt=request.negative_prompt,
-            mode=mode,
-            max_retries=3
-        )
-        
-        # Build response
-        if result.success:
-            return GenerationResponse(
-                success=True,
-                image_url=result.image_url,
-                image_base64=result.image_base64,
-                inference_time=result.inference_time,
-                model_version=result.model_version,
-                seed=result.seed
-            )
-        else:
-            # Return error details
-            return GenerationResponse(
-                success=False,
-                inference_time=result.inference_time,
-                model_version="",
-                error={
-                    "code": result.error_code,
-                    "message": result.error_message,
-                    "action": _get_error_action(result.error_code),
-                    "retry": _is_retryable(result.error_code)
-                }
-            )
-    
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -295,13 +658,21 @@ async def generate_image(request: GenerationRequest):
         )
 
 
-@app.post("/api/batch-generate")
-async def batch_generate(requests: list[GenerationRequest], background_tasks: BackgroundTasks):
-    """
-    Generate multiple images (for future use)
-    """
-    # TODO: Implement batch generation
-    raise HTTPException(status_code=501, detail="Batch generation not yet implemented")
+async def _upload_image(image_bytes: bytes, key: str, image_format: str) -> str:
+    """Upload exported image to S3 and return a short-lived presigned GET URL"""
+    
+    await s3_client.put_object(
+        Bucket=S3_BUCKET,
+        Key=key,
+        Body=image_bytes,
+        ContentType=f"image/{image_format}"
+    )
+    
+    return await s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": S3_BUCKET, "Key": key},
+        ExpiresIn=S3_URL_TTL
+    )
 
 
 def _get_error_action(error_code: int) -> str:
@@ -329,10 +700,22 @@ if __name__ == "__main__":
     # Run server
     port = int(os.getenv("PORT", "8000"))
     
+    dev = bool(int(os.getenv("DEV", "0")))
+    
+    # Without S3 the image store is per process, so images are only
+    # reachable with a single worker
+    workers = int(os.getenv("WEB_CONCURRENCY", "4")) if S3_BUCKET else 1
+    
+    # uvloop + httptools ship with uvicorn[standard]; reload and workers are
+    # mutually exclusive, so the file watcher only runs when DEV=1
     uvicorn.run(
         "api_server:app",
         host="0.0.0.0",
         port=port,
-        reload=True,  # Disable in production
-        log_level="info"
+        workers=1 if dev else workers,
+        loop="uvloop",
+        http="httptools",
+        reload=dev,
+        log_level="info",
+        access_log=False
     )
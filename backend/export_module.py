@@ -11,6 +11,62 @@ import piexif
 from datetime import datetime
 from typing import Dict, Optional, Tuple
 import io
+import json
+import time
+
+
+# SynthID placeholder key as MSB-first bits (same order as format(ord(c), '08b'))
+_WATERMARK_KEY = "IdentityLens-AI-Generated"
+_WATERMARK_BITS = np.unpackbits(np.frombuffer(_WATERMARK_KEY.encode("ascii"), dtype=np.uint8))
+
+
+# Constant EXIF tags shared by every export
+_EXIF_TEMPLATE_0TH = {
+    piexif.ImageIFD.Software: b"IdentityLens AI",
+    piexif.ImageIFD.Artist: b"AI Generated - IdentityLens",
+    piexif.ImageIFD.Copyright: b"AI Generated Image"
+}
+
+# (epoch second, EXIF DateTime bytes) - reused for exports within the same second
+_exif_timestamp_cache: Tuple[int, bytes] = (0, b"")
+
+
+def _exif_timestamp() -> bytes:
+    """EXIF DateTime string for the current second"""
+    
+    global _exif_timestamp_cache
+    
+    now = int(time.time())
+    if _exif_timestamp_cache[0] != now:
+        timestamp = datetime.fromtimestamp(now).strftime("%Y:%m:%d %H:%M:%S")
+        _exif_timestamp_cache = (now, timestamp.encode())
+    
+    return _exif_timestamp_cache[1]
+
+
+# Platform-specific requirements for social media export
+_SOCIAL_MEDIA_CONFIGS = {
+    "instagram": {
+        "max_size": 1080,
+        "aspect_ratio": (4, 5),  # Portrait
+        "quality": 95
+    },
+    "whatsapp": {
+        "max_size": 1600,
+        "aspect_ratio": None,  # Keep original
+        "quality": 85
+    },
+    "facebook": {
+        "max_size": 2048,
+        "aspect_ratio": (16, 9),  # Landscape
+        "quality": 90
+    },
+    "twitter": {
+        "max_size": 4096,
+        "aspect_ratio": (16, 9),
+        "quality": 85
+    }
+}
 
 
 class ImageExporter:
@@ -27,7 +83,8 @@ class ImageExporter:
         output_format: str = "webp",
         quality: int = 95,
         add_watermark: bool = True,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        lossless: bool = False
     ) -> Tuple[bytes, str]:
         """
         Export image with all optimizations
@@ -38,6 +95,7 @@ class ImageExporter:
             quality: 1-100
             add_watermark: Add SynthID watermark
             metadata: Custom metadata to embed
+            lossless: Encode WebP losslessly (much larger, slower)
         
         Returns:
             image_bytes: Encoded image
@@ -46,19 +104,15 @@ class ImageExporter:
         
         print(f"📤 Exporting as {output_format.upper()}...")
         
-        # Convert numpy to PIL
-        pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
-        
-        # Add invisible watermark (SynthID)
+        # Add invisible watermark (SynthID) - one copy so the caller's array is untouched
         if add_watermark:
-            pil_image = self._add_synthid_watermark(pil_image)
+            image = self._add_synthid_watermark(np.array(image))
         
-        # Embed metadata
-        if metadata:
-            pil_image = self._embed_metadata(pil_image, metadata)
+        # Build metadata (embedded by the final encode)
+        exif_bytes = self._embed_metadata(metadata) if metadata else None
         
         # Encode based on format
-        image_bytes = self._encode_image(pil_image, output_format, quality)
+        image_bytes = self._encode_image(image, output_format, quality, exif_bytes, lossless)
         
         # Generate filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -68,9 +122,9 @@ class ImageExporter:
         
         return image_bytes, filename
     
-    def _add_synthid_watermark(self, image: Image.Image) -> Image.Image:
+    def _add_synthid_watermark(self, image: np.ndarray) -> np.ndarray:
         """
-        Add invisible SynthID watermark
+        Add invisible SynthID watermark (modifies image in place)
         
         Note: This is a placeholder for actual SynthID implementation
         Google SynthID requires proprietary access
@@ -81,82 +135,52 @@ class ImageExporter:
         # Placeholder: Add subtle pattern in least significant bits
         # In production, use actual SynthID library
         
-        img_array = np.array(image)
-        
-        # Create watermark pattern
-        h, w = img_array.shape[:2]
-        watermark_key = "IdentityLens-AI-Generated"
-        
-        # Convert text to binary
-        watermark_binary = ''.join(format(ord(c), '08b') for c in watermark_key)
-        
-        # Embed in LSB of blue channel (least visible)
-        watermark_idx = 0
-        for i in range(min(len(watermark_binary), h * w)):
-            if watermark_idx >= len(watermark_binary):
-                break
-            
-            y = i // w
-            x = i % w
-            
-            # Modify LSB of blue channel
-            if watermark_idx < len(watermark_binary):
-                img_array[y, x, 2] = (img_array[y, x, 2] & 0xFE) | int(watermark_binary[watermark_idx])
-                watermark_idx += 1
-        
-        watermarked_image = Image.fromarray(img_array)
+        # Embed in LSB of blue channel (least visible), row-major pixel order.
+        # Slicing the (H*W, C) view keeps a strided view, so the write lands in image.
+        blue = image.reshape(-1, image.shape[2])[:, 2]
+        n = min(_WATERMARK_BITS.size, blue.size)
+        blue[:n] = (blue[:n] & np.uint8(0xFE)) | _WATERMARK_BITS[:n]
         
         print("  ✓ Watermark embedded")
         
-        return watermarked_image
+        return image
     
-    def _embed_metadata(self, image: Image.Image, metadata: Dict) -> Image.Image:
+    def _embed_metadata(self, metadata: Dict) -> bytes:
         """
-        Embed EXIF metadata
+        Build EXIF metadata block
         
         Args:
-            image: PIL Image
             metadata: Dict with keys: model, prompt, timestamp, etc.
         
         Returns:
-            image_with_metadata: Image with EXIF data
+            exif_bytes: EXIF data to pass to the final image save
         """
         
         print("  📝 Embedding metadata...")
         
-        # Prepare EXIF data
+        # Prepare EXIF data (Software, Artist, Copyright come from the template)
         exif_dict = {
-            "0th": {},
+            "0th": dict(_EXIF_TEMPLATE_0TH),
             "Exif": {},
             "GPS": {},
             "1st": {},
             "thumbnail": None
         }
         
-        # Software tag
-        exif_dict["0th"][piexif.ImageIFD.Software] = b"IdentityLens AI"
-        
         # Model used
         if "model" in metadata:
             exif_dict["0th"][piexif.ImageIFD.Model] = metadata["model"].encode()
         
-        # Artist/Creator
-        exif_dict["0th"][piexif.ImageIFD.Artist] = b"AI Generated - IdentityLens"
-        
-        # Copyright
-        exif_dict["0th"][piexif.ImageIFD.Copyright] = b"AI Generated Image"
-        
         # Description (store prompt)
         if "prompt" in metadata:
             exif_dict["0th"][piexif.ImageIFD.ImageDescription] = metadata["prompt"][:200].encode()
         
         # Datetime
-        timestamp = datetime.now().strftime("%Y:%m:%d %H:%M:%S")
-        exif_dict["0th"][piexif.ImageIFD.DateTime] = timestamp.encode()
-        exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = timestamp.encode()
+        timestamp = _exif_timestamp()
+        exif_dict["0th"][piexif.ImageIFD.DateTime] = timestamp
+        exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = timestamp
         
         # User comment (JSON metadata)
-        import json
         comment = json.dumps({
             "generator": "IdentityLens",
             "model": metadata.get("model", "Flux.1 + PuLID"),
@@ -169,64 +193,75 @@ class ImageExporter:
         # Encode EXIF
         exif_bytes = piexif.dump(exif_dict)
         
-        # Create new image with EXIF
-        output = io.BytesIO()
-        image.save(output, format="JPEG", exif=exif_bytes)
-        output.seek(0)
-        
-        image_with_metadata = Image.open(output)
-        
         print("  ✓ Metadata embedded")
         
-        return image_with_metadata
+        return exif_bytes
     
     def _encode_image(
         self,
-        image: Image.Image,
+        image: np.ndarray,
         format: str,
-        quality: int
+        quality: int,
+        exif_bytes: Optional[bytes] = None,
+        lossless: bool = False
     ) -> bytes:
         """
         Encode image in specified format
         
         Args:
-            image: PIL Image
+            image: RGB image
             format: jpeg, heif, webp, png
             quality: 1-100
+            exif_bytes: Optional EXIF block to embed
+            lossless: Encode WebP losslessly
         
         Returns:
             image_bytes: Encoded image data
         """
         
+        if format.lower() == "webp" and not exif_bytes:
+            # libwebp directly via OpenCV (no PIL conversion); quality > 100 = lossless
+            webp_quality = 101 if lossless else quality
+            ok, buffer = cv2.imencode(
+                ".webp",
+                cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                [cv2.IMWRITE_WEBP_QUALITY, webp_quality]
+            )
+            if ok:
+                return buffer.tobytes()
+        
+        # Pillow path (EXIF embedding, HEIF, PNG, JPEG)
+        image = Image.fromarray(image)
         output = io.BytesIO()
+        extra = {"exif": exif_bytes} if exif_bytes else {}
         
         if format.lower() == "jpeg":
-            image.save(output, format="JPEG", quality=quality, optimize=True)
+            image.save(output, format="JPEG", quality=quality, optimize=True, **extra)
         
         elif format.lower() == "webp":
-            # WebP lossless for high quality, lossy for compression
-            if quality >= 90:
-                image.save(output, format="WEBP", lossless=True)
+            # Lossy q95 is visually identical for photos at a fraction of the size
+            if lossless:
+                image.save(output, format="WEBP", lossless=True, **extra)
             else:
-                image.save(output, format="WEBP", quality=quality)
+                image.save(output, format="WEBP", quality=quality, method=6, **extra)
         
         elif format.lower() == "heif":
             # HEIF requires pillow-heif
             try:
                 import pillow_heif
                 pillow_heif.register_heif_opener()
-                image.save(output, format="HEIF", quality=quality)
+                image.save(output, format="HEIF", quality=quality, **extra)
             except ImportError:
                 print("  ⚠️  HEIF not supported, falling back to JPEG")
-                image.save(output, format="JPEG", quality=quality, optimize=True)
+                image.save(output, format="JPEG", quality=quality, optimize=True, **extra)
         
         elif format.lower() == "png":
             # PNG is lossless
-            image.save(output, format="PNG", compress_level=6)
+            image.save(output, format="PNG", compress_level=6, **extra)
         
         else:
             # Default to JPEG
-            image.save(output, format="JPEG", quality=quality, optimize=True)
+            image.save(output, format="JPEG", quality=quality, optimize=True, **extra)
         
         return output.getvalue()
     
@@ -243,34 +278,11 @@ class ImageExporter:
             platform: instagram, whatsapp, facebook, twitter
         
         Returns:
-            optimized: Resized and optimized image
+            optimized: Resized and optimized image (the input itself when no
+                resize is needed - copy before mutating)
         """
         
-        # Platform-specific requirements
-        configs = {
-            "instagram": {
-                "max_size": 1080,
-                "aspect_ratio": (4, 5),  # Portrait
-                "quality": 95
-            },
-            "whatsapp": {
-                "max_size": 1600,
-                "aspect_ratio": None,  # Keep original
-                "quality": 85
-            },
-            "facebook": {
-                "max_size": 2048,
-                "aspect_ratio": (16, 9),  # Landscape
-                "quality": 90
-            },
-            "twitter": {
-                "max_size": 4096,
-                "aspect_ratio": (16, 9),
-                "quality": 85
-            }
-        }
-        
-        config = configs.get(platform, configs["instagram"])
+        config = _SOCIAL_MEDIA_CONFIGS.get(platform, _SOCIAL_MEDIA_CONFIGS["instagram"])
         
         h, w = image.shape[:2]
         
@@ -281,15 +293,16 @@ class ImageExporter:
             new_w = int(w * scale)
             new_h = int(h * scale)
             
+            # INTER_AREA: area averaging is the fast, alias-free kernel for downscaling
             optimized = cv2.resize(
                 image,
                 (new_w, new_h),
-                interpolation=cv2.INTER_LANCZOS4
+                interpolation=cv2.INTER_AREA
             )
         else:
-            optimized = image.copy()
+            optimized = image
         
-        print(f"  ✓ Optimized for {platform}: {new_w}x{new_h}")
+        print(f"  ✓ Optimized for {platform}: {optimized.shape[1]}x{optimized.shape[0]}")
         
         return optimized
 
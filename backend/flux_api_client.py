@@ -7,8 +7,16 @@ Model: Flux.1 schnell (speed mode) / Flux.1 dev (quality mode)
 """
 
 import requests
+import httpx
+import cv2
+import numpy as np
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import asyncio
 import base64
-import json
+import functools
+import hashlib
+import orjson
 import time
 import os
 from typing import Dict, Optional, List
@@ -22,9 +30,9 @@ class GenerationMode(Enum):
     QUALITY = "quality"  # Flux dev - 8-10s inference
 
 
-@dataclass
+@dataclass(slots=True)
 class InferenceResult:
-    """Result from cloud inference"""
+    """Result from cloud inference (mutable: timing and harmonization update it)"""
     success: bool
     image_url: Optional[str] = None
     image_base64: Optional[str] = None
@@ -35,6 +43,20 @@ class InferenceResult:
     error_message: Optional[str] = None
 
 
+# Seconds to wait on a slow async attempt before hedging with a second one
+# (well above typical inference time, so only tail requests are duplicated)
+HEDGE_DELAYS = {
+    GenerationMode.SPEED: 10.0,
+    GenerationMode.QUALITY: 20.0
+}
+
+
+# Laplacian variance of the 256px grayscale output above which the
+# composite looks "pasted" and remote img2img harmonization is worth a call
+# (below it, the local refinement pass is enough)
+HARMONIZATION_EDGE_THRESHOLD = 200.0
+
+
 class ErrorCodes:
     """Error code definitions"""
     NO_FACE_DETECTED = 1001
@@ -79,6 +101,38 @@ ERROR_MESSAGES = {
     }
 }
 
+# Error codes that must not be retried (codes without an entry are retryable)
+_NON_RETRYABLE_CODES = frozenset(
+    code for code, info in ERROR_MESSAGES.items() if not info.get("retry", False)
+)
+
+# Provider configuration per generation mode
+_FAL_CONFIGS = {
+    GenerationMode.SPEED: {
+        "model": "flux-schnell",
+        "steps": 4,
+        "guidance": 3.5
+    },
+    GenerationMode.QUALITY: {
+        "model": "flux-dev",
+        "steps": 30,
+        "guidance": 7.5
+    }
+}
+
+_REPLICATE_CONFIGS = {
+    GenerationMode.SPEED: {
+        "version_id": "black-forest-labs/flux-schnell",
+        "steps": 4,
+        "guidance": 3.5
+    },
+    GenerationMode.QUALITY: {
+        "version_id": "black-forest-labs/flux-dev",
+        "steps": 50,
+        "guidance": 7.5
+    }
+}
+
 
 class FluxPuLIDClient:
     """
@@ -94,7 +148,8 @@ class FluxPuLIDClient:
         self,
         api_key: str,
         provider: str = "fal",  # fal | replicate | comfyui
-        model: str = "flux-schnell"
+        model: str = "flux-schnell",
+        max_concurrency: int = 16
     ):
         """
         Initialize client
@@ -103,14 +158,37 @@ class FluxPuLIDClient:
             api_key: API key for the provider
             provider: API provider (fal, replicate, comfyui)
             model: Base model (flux-schnell or flux-dev)
+            max_concurrency: Maximum in-flight async generations (provider concurrency limit)
         """
         self.api_key = api_key
         self.provider = provider
         self.model = model
         
+        # Keep-alive pool for the sync path (no TLS handshake per call);
+        # retries are handled by generate_with_retry
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=Retry(total=0))
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        auth_scheme = "Token" if provider == "replicate" else "Key"
+        self._session.headers.update({
+            "Authorization": f"{auth_scheme} {api_key}",
+            "Content-Type": "application/json"
+        })
+        
+        # Shared keep-alive pool (opened by the first async call, so sync-only
+        # users never hold one) and concurrency cap for the async path
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sem = asyncio.Semaphore(max_concurrency)
+        
+        # Fal storage URLs of uploaded reference faces, keyed by content hash
+        # (retries and repeat requests reuse the upload)
+        self._uploaded_faces: Dict[str, str] = {}
+        
         # Provider endpoints
         self.endpoints = {
             "fal": "https://fal.run/fal-ai/flux-pro/v1.1-ultra",
+            "fal_storage": "https://rest.alpha.fal.ai/storage/upload/initiate",
             "replicate": "https://api.replicate.com/v1/predictions",
             "comfyui": os.getenv("COMFYUI_ENDPOINT", "http://localhost:8188")
         }
@@ -121,7 +199,8 @@ class FluxPuLIDClient:
         master_prompt: str,
         negative_prompt: str,
         mode: GenerationMode = GenerationMode.SPEED,
-        lighting_params: Optional[Dict] = None
+        lighting_params: Optional[Dict] = None,
+        seed: int = -1
     ) -> InferenceResult:
         """
         Generate identity-preserved image
@@ -132,6 +211,7 @@ class FluxPuLIDClient:
             negative_prompt: Context-aware negatives
             mode: Generation mode (speed or quality)
             lighting_params: Optional lighting parameters
+            seed: Generation seed (-1 = random)
         
         Returns:
             InferenceResult with image and metadata
@@ -151,11 +231,11 @@ class FluxPuLIDClient:
             # Build request based on provider
             if self.provider == "fal":
                 result = self._generate_fal(
-                    identity_packet, master_prompt, negative_prompt, mode
+                    identity_packet, master_prompt, negative_prompt, mode, seed
                 )
             elif self.provider == "replicate":
                 result = self._generate_replicate(
-                    identity_packet, master_prompt, negative_prompt, mode
+                    identity_packet, master_prompt, negative_prompt, mode, seed
                 )
             else:
                 raise ValueError(f"Unsupported provider: {self.provider}")
@@ -187,23 +267,114 @@ class FluxPuLIDClient:
         identity_packet: Dict,
         master_prompt: str,
         negative_prompt: str,
-        mode: GenerationMode
+        mode: GenerationMode,
+        seed: int = -1
     ) -> InferenceResult:
         """Generate using Fal.ai API"""
         
         config = self._get_fal_config(mode)
+        face_image_url = self._upload_face_fal(identity_packet)
+        request_data = self._build_fal_request(
+            face_image_url, master_prompt, negative_prompt, config, seed
+        )
+        
+        # Make request
+        response = self._session.post(
+            self.endpoints["fal"],
+            data=orjson.dumps(request_data),
+            timeout=30
+        )
+        
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        
+        return InferenceResult(
+            success=True,
+            image_url=data["images"][0]["url"],
+            model_version=config["model"],
+            seed=data.get("seed", -1)
+        )
+    
+    def _upload_face_fal(self, identity_packet: Dict) -> str:
+        """
+        Upload the reference face to Fal storage and return its URL
+        
+        Sending a short URL instead of a base64 data URL keeps the 33%
+        larger payload out of every generation request. Falls back to the
+        data URL if the upload fails.
+        """
         
-        # Extract face image
         face_image_b64 = identity_packet["image"]["cleanFace"]
+        digest = self._face_digest(face_image_b64)
         
-        # Build request
-        request_data = {
+        face_image_url = self._uploaded_faces.get(digest)
+        if face_image_url:
+            return face_image_url
+        
+        try:
+            response = self._session.post(
+                self.endpoints["fal_storage"],
+                data=orjson.dumps(self._build_storage_request(digest)),
+                timeout=10
+            )
+            response.raise_for_status()
+            upload = orjson.loads(response.content)
+            
+            # Presigned upload URL: must not carry the API key
+            response = self._session.put(
+                upload["upload_url"],
+                data=base64.b64decode(face_image_b64),
+                headers={"Authorization": None, "Content-Type": "image/jpeg"},
+                timeout=30
+            )
+            response.raise_for_status()
+        
+        except Exception as e:
+            print(f"Face upload failed: {e}, sending inline")
+            return f"data:image/jpeg;base64,{face_image_b64}"
+        
+        return self._remember_upload(digest, upload["file_url"])
+    
+    @staticmethod
+    def _face_digest(face_image_b64: str) -> str:
+        """Content hash of a base64 reference face"""
+        return hashlib.blake2b(face_image_b64.encode(), digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _build_storage_request(digest: str) -> Dict:
+        """Build Fal storage upload initiation request body"""
+        
+        return {
+            "content_type": "image/jpeg",
+            "file_name": f"{digest}.jpg"
+        }
+    
+    def _remember_upload(self, digest: str, face_image_url: str) -> str:
+        """Cache an uploaded face URL (oldest entries evicted first)"""
+        
+        if len(self._uploaded_faces) >= 256:
+            self._uploaded_faces.pop(next(iter(self._uploaded_faces)))
+        self._uploaded_faces[digest] = face_image_url
+        
+        return face_image_url
+    
+    def _build_fal_request(
+        self,
+        face_image_url: str,
+        master_prompt: str,
+        negative_prompt: str,
+        config: Dict,
+        seed: int = -1
+    ) -> Dict:
+        """Build Fal.ai generation request body"""
+        
+        return {
             "prompt": master_prompt,
             "negative_prompt": negative_prompt,
             
             # PuLID identity preservation
             "image_prompts": [{
-                "image_url": f"data:image/jpeg;base64,{face_image_b64}",
+                "image_url": face_image_url,
                 "weight": 0.85  # Fidelity weight
             }],
             
@@ -218,7 +389,7 @@ class FluxPuLIDClient:
                 "height": 1024
             },
             "num_images": 1,
-            "seed": -1,
+            "seed": seed,
             
             # Safety and optimization
             "enable_safety_checker": False,
@@ -226,36 +397,22 @@ class FluxPuLIDClient:
             "output_format": "jpeg",
             "jpeg_quality": 90
         }
+    
+    def _fal_headers(self) -> Dict:
+        """Fal.ai request headers"""
         
-        # Make request
-        headers = {
+        return {
             "Authorization": f"Key {self.api_key}",
             "Content-Type": "application/json"
         }
-        
-        response = requests.post(
-            self.endpoints["fal"],
-            headers=headers,
-            json=request_data,
-            timeout=30
-        )
-        
-        response.raise_for_status()
-        data = response.json()
-        
-        return InferenceResult(
-            success=True,
-            image_url=data["images"][0]["url"],
-            model_version=config["model"],
-            seed=data.get("seed", -1)
-        )
     
     def _generate_replicate(
         self,
         identity_packet: Dict,
         master_prompt: str,
         negative_prompt: str,
-        mode: GenerationMode
+        mode: GenerationMode,
+        seed: int = -1
     ) -> InferenceResult:
         """Generate using Replicate API"""
         
@@ -278,59 +435,51 @@ class FluxPuLIDClient:
             }
         }
         
-        headers = {
-            "Authorization": f"Token {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        if seed >= 0:
+            request_data["input"]["seed"] = seed
         
-        # Start prediction
-        response = requests.post(
+        # Start prediction; Prefer: wait holds the response open until the
+        # prediction finishes (up to 60s), so most jobs need no polling
+        response = self._session.post(
             self.endpoints["replicate"],
-            headers=headers,
-            json=request_data,
-            timeout=30
+            headers={"Prefer": "wait=60"},
+            data=orjson.dumps(request_data),
+            timeout=70
         )
         
         response.raise_for_status()
-        prediction = response.json()
+        prediction = orjson.loads(response.content)
+        
+        result = self._replicate_result(prediction)
+        if result is not None:
+            return result
         
         # Poll for completion
         prediction_url = prediction["urls"]["get"]
-        result = self._poll_replicate_prediction(prediction_url, headers)
+        result = self._poll_replicate_prediction(prediction_url)
         
         return result
     
     def _poll_replicate_prediction(
         self,
         prediction_url: str,
-        headers: Dict,
         max_wait: int = 60
     ) -> InferenceResult:
-        """Poll Replicate prediction until completion"""
+        """Poll Replicate prediction until completion (backoff 0.25s -> 2s)"""
         
         start_time = time.time()
+        attempt = 0
         
         while time.time() - start_time < max_wait:
-            response = requests.get(prediction_url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            status = data["status"]
+            time.sleep(min(0.25 * (1.5 ** attempt), 2.0))
+            attempt += 1
             
-            if status == "succeeded":
-                return InferenceResult(
-                    success=True,
-                    image_url=data["output"][0],
-                    model_version="flux-schnell"
-                )
-            elif status == "failed":
-                return InferenceResult(
-                    success=False,
-                    error_code=ErrorCodes.API_ERROR,
-                    error_message=data.get("error", "Prediction failed")
-                )
+            response = self._session.get(prediction_url, timeout=30)
+            response.raise_for_status()
             
-            time.sleep(1)
+            result = self._replicate_result(orjson.loads(response.content))
+            if result is not None:
+                return result
         
         return InferenceResult(
             success=False,
@@ -338,6 +487,27 @@ class FluxPuLIDClient:
             error_message="Prediction timeout"
         )
     
+    @staticmethod
+    def _replicate_result(data: Dict) -> Optional[InferenceResult]:
+        """InferenceResult for a finished Replicate prediction, None while running"""
+        
+        status = data["status"]
+        
+        if status == "succeeded":
+            return InferenceResult(
+                success=True,
+                image_url=data["output"][0],
+                model_version="flux-schnell"
+            )
+        elif status in ("failed", "canceled"):
+            return InferenceResult(
+                success=False,
+                error_code=ErrorCodes.API_ERROR,
+                error_message=data.get("error") or "Prediction failed"
+            )
+        
+        return None
+    
     def _apply_harmonization(
         self,
         result: InferenceResult,
@@ -353,38 +523,70 @@ class FluxPuLIDClient:
         if not result.image_url:
             return result
         
-        config = self._get_fal_config(mode)
+        try:
+            image_bytes = self._fetch_result_image(result.image_url)
+            if not _needs_harmonization(image_bytes):
+                # Already natural; hand the bytes downstream instead of a second download
+                result.image_base64 = base64.b64encode(image_bytes).decode()
+                return result
+        except Exception as e:
+            print(f"Harmonization check failed: {e}, harmonizing")
         
-        harmonize_request = {
-            "prompt": "professional photography, photorealistic, natural skin texture, detailed pores",
-            "image_url": result.image_url,
-            "strength": denoising_strength,  # 0.35-0.45 range
-            "num_inference_steps": config["steps"],
-            "guidance_scale": config["guidance"]
-        }
+        harmonize_request = self._build_harmonize_request(result, mode, denoising_strength)
         
         try:
-            headers = {
-                "Authorization": f"Key {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
+            response = self._session.post(
                 f"{self.endpoints['fal']}/img2img",
-                headers=headers,
-                json=harmonize_request,
+                data=orjson.dumps(harmonize_request),
                 timeout=20
             )
             
             if response.status_code == 200:
-                data = response.json()
+                data = orjson.loads(response.content)
                 result.image_url = data["images"][0]["url"]
         
         except Exception as e:
             print(f"Harmonization failed: {e}, using original")
         
+        return self._inline_data_url(result)
+    
+    @staticmethod
+    def _inline_data_url(result: InferenceResult) -> InferenceResult:
+        """Carry a sync_mode data: URL result as image_base64 (it cannot be downloaded)"""
+        
+        if result.image_url.startswith("data:"):
+            result.image_base64 = result.image_url.split(",", 1)[1]
         return result
     
+    def _fetch_result_image(self, image_url: str) -> bytes:
+        """Generated image bytes (inline data URL with sync_mode, else downloaded)"""
+        
+        if image_url.startswith("data:"):
+            return base64.b64decode(image_url.split(",", 1)[1])
+        
+        # CDN download: do not send the API key
+        response = self._session.get(image_url, headers={"Authorization": None}, timeout=20)
+        response.raise_for_status()
+        return response.content
+    
+    def _build_harmonize_request(
+        self,
+        result: InferenceResult,
+        mode: GenerationMode,
+        denoising_strength: float
+    ) -> Dict:
+        """Build Fal.ai img2img harmonization request body"""
+        
+        config = self._get_fal_config(mode)
+        
+        return {
+            "prompt": "professional photography, photorealistic, natural skin texture, detailed pores",
+            "image_url": result.image_url,
+            "strength": denoising_strength,  # 0.35-0.45 range
+            "num_inference_steps": config["steps"],
+            "guidance_scale": config["guidance"]
+        }
+    
     def _validate_identity_packet(self, packet: Dict) -> bool:
         """Validate identity packet has required fields"""
         
@@ -402,39 +604,11 @@ class FluxPuLIDClient:
     
     def _get_fal_config(self, mode: GenerationMode) -> Dict:
         """Get Fal.ai configuration based on mode"""
-        
-        configs = {
-            GenerationMode.SPEED: {
-                "model": "flux-schnell",
-                "steps": 4,
-                "guidance": 3.5
-            },
-            GenerationMode.QUALITY: {
-                "model": "flux-dev",
-                "steps": 30,
-                "guidance": 7.5
-            }
-        }
-        
-        return configs[mode]
+        return _FAL_CONFIGS[mode]
     
     def _get_replicate_config(self, mode: GenerationMode) -> Dict:
         """Get Replicate configuration based on mode"""
-        
-        configs = {
-            GenerationMode.SPEED: {
-                "version_id": "black-forest-labs/flux-schnell",
-                "steps": 4,
-                "guidance": 3.5
-            },
-            GenerationMode.QUALITY: {
-                "version_id": "black-forest-labs/flux-dev",
-                "steps": 50,
-                "guidance": 7.5
-            }
-        }
-        
-        return configs[mode]
+        return _REPLICATE_CONFIGS[mode]
     
     def generate_with_retry(
         self,
@@ -442,7 +616,8 @@ class FluxPuLIDClient:
         master_prompt: str,
         negative_prompt: str,
         mode: GenerationMode = GenerationMode.SPEED,
-        max_retries: int = 3
+        max_retries: int = 3,
+        seed: int = -1
     ) -> InferenceResult:
         """Generate with automatic retry on transient failures"""
         
@@ -451,17 +626,16 @@ class FluxPuLIDClient:
                 identity_packet,
                 master_prompt,
                 negative_prompt,
-                mode
+                mode,
+                seed=seed
             )
             
             if result.success:
                 return result
             
             # Check if error is retryable
-            if result.error_code in ERROR_MESSAGES:
-                error_info = ERROR_MESSAGES[result.error_code]
-                if not error_info.get("retry", False):
-                    return result
+            if result.error_code in _NON_RETRYABLE_CODES:
+                return result
             
             if attempt < max_retries - 1:
                 wait_time = 2 ** attempt  # Exponential backoff
@@ -469,6 +643,364 @@ class FluxPuLIDClient:
                 time.sleep(wait_time)
         
         return result
+    
+    @staticmethod
+    def _batch_key(request: Dict, index: int) -> tuple:
+        """
+        Identity of a generate_with_retry request for batch de-duplication
+        
+        Random-seed requests (seed < 0) are distinct variations and never
+        merge; the batch index keeps their keys unique.
+        """
+        
+        if request.get("seed", -1) < 0:
+            return ("random", index)
+        
+        return (
+            request["identity_packet"].get("image", {}).get("cleanFace"),
+            request["master_prompt"],
+            request["negative_prompt"],
+            request.get("mode", GenerationMode.SPEED),
+            request.get("seed", -1)
+        )
+    
+    async def generate_image_async(
+        self,
+        identity_packet: Dict,
+        master_prompt: str,
+        negative_prompt: str,
+        mode: GenerationMode = GenerationMode.SPEED,
+        lighting_params: Optional[Dict] = None,
+        seed: int = -1
+    ) -> InferenceResult:
+        """
+        Async variant of generate_image
+        
+        Fal.ai calls go through the shared pooled AsyncClient; other
+        providers run the synchronous path in a worker thread.
+        """
+        
+        if self.provider != "fal":
+            return await asyncio.to_thread(
+                self.generate_image,
+                identity_packet, master_prompt, negative_prompt, mode, lighting_params, seed
+            )
+        
+        start_time = time.time()
+        
+        try:
+            # Validate inputs
+            if not self._validate_identity_packet(identity_packet):
+                return InferenceResult(
+                    success=False,
+                    error_code=ErrorCodes.NO_FACE_DETECTED,
+                    error_message=ERROR_MESSAGES[ErrorCodes.NO_FACE_DETECTED]["tr"]
+                )
+            
+            result = await self._generate_fal_async(
+                identity_packet, master_prompt, negative_prompt, mode, seed
+            )
+            
+            # Apply harmonization if successful
+            if result.success and result.image_url:
+                result = await self._apply_harmonization_async(result, mode)
+            
+            result.inference_time = time.time() - start_time
+            return result
+            
+        except httpx.TimeoutException:
+            return InferenceResult(
+                success=False,
+                error_code=ErrorCodes.INFERENCE_TIMEOUT,
+                error_message=ERROR_MESSAGES[ErrorCodes.INFERENCE_TIMEOUT]["tr"],
+                inference_time=time.time() - start_time
+            )
+        except Exception as e:
+            return InferenceResult(
+                success=False,
+                error_code=ErrorCodes.API_ERROR,
+                error_message=str(e),
+                inference_time=time.time() - start_time
+            )
+    
+    async def _generate_fal_async(
+        self,
+        identity_packet: Dict,
+        master_prompt: str,
+        negative_prompt: str,
+        mode: GenerationMode,
+        seed: int = -1
+    ) -> InferenceResult:
+        """Generate using Fal.ai API (async)"""
+        
+        config = self._get_fal_config(mode)
+        face_image_url = await self._upload_face_fal_async(identity_packet)
+        request_data = self._build_fal_request(
+            face_image_url, master_prompt, negative_prompt, config, seed
+        )
+        
+        response = await self._http().post(
+            self.endpoints["fal"],
+            headers=self._fal_headers(),
+            content=orjson.dumps(request_data)
+        )
+        
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        
+        return InferenceResult(
+            success=True,
+            image_url=data["images"][0]["url"],
+            model_version=config["model"],
+            seed=data.get("seed", -1)
+        )
+    
+    async def _upload_face_fal_async(self, identity_packet: Dict) -> str:
+        """Async variant of _upload_face_fal"""
+        
+        face_image_b64 = identity_packet["image"]["cleanFace"]
+        digest = self._face_digest(face_image_b64)
+        
+        face_image_url = self._uploaded_faces.get(digest)
+        if face_image_url:
+            return face_image_url
+        
+        try:
+            response = await self._http().post(
+                self.endpoints["fal_storage"],
+                headers=self._fal_headers(),
+                content=orjson.dumps(self._build_storage_request(digest)),
+                timeout=10
+            )
+            response.raise_for_status()
+            upload = orjson.loads(response.content)
+            
+            response = await self._http().put(
+                upload["upload_url"],
+                content=base64.b64decode(face_image_b64),
+                headers={"Content-Type": "image/jpeg"}
+            )
+            response.raise_for_status()
+        
+        except Exception as e:
+            print(f"Face upload failed: {e}, sending inline")
+            return f"data:image/jpeg;base64,{face_image_b64}"
+        
+        return self._remember_upload(digest, upload["file_url"])
+    
+    async def _apply_harmonization_async(
+        self,
+        result: InferenceResult,
+        mode: GenerationMode,
+        denoising_strength: float = 0.40
+    ) -> InferenceResult:
+        """Async variant of _apply_harmonization"""
+        
+        if not result.image_url:
+            return result
+        
+        try:
+            image_bytes = await self._fetch_result_image_async(result.image_url)
+            if not await asyncio.to_thread(_needs_harmonization, image_bytes):
+                result.image_base64 = base64.b64encode(image_bytes).decode()
+                return result
+        except Exception as e:
+            print(f"Harmonization check failed: {e}, harmonizing")
+        
+        harmonize_request = self._build_harmonize_request(result, mode, denoising_strength)
+        
+        try:
+            response = await self._http().post(
+                f"{self.endpoints['fal']}/img2img",
+                headers=self._fal_headers(),
+                content=orjson.dumps(harmonize_request),
+                timeout=20
+            )
+            
+            if response.status_code == 200:
+                data = orjson.loads(response.content)
+                result.image_url = data["images"][0]["url"]
+        
+        except Exception as e:
+            print(f"Harmonization failed: {e}, using original")
+        
+        return self._inline_data_url(result)
+    
+    async def _fetch_result_image_async(self, image_url: str) -> bytes:
+        """Async variant of _fetch_result_image"""
+        
+        if image_url.startswith("data:"):
+            return base64.b64decode(image_url.split(",", 1)[1])
+        
+        response = await self._http().get(image_url, timeout=20)
+        response.raise_for_status()
+        return response.content
+    
+    async def generate_with_retry_async(
+        self,
+        identity_packet: Dict,
+        master_prompt: str,
+        negative_prompt: str,
+        mode: GenerationMode = GenerationMode.SPEED,
+        max_retries: int = 3,
+        seed: int = -1
+    ) -> InferenceResult:
+        """
+        Async generate with retry and hedging, bounded by the client concurrency limit
+        
+        Failed attempts are retried with exponential backoff. An attempt
+        still running after HEDGE_DELAYS[mode] gets a hedged duplicate; the
+        first usable result wins and the other in-flight attempts are
+        cancelled. Every attempt, hedges included, holds its own semaphore
+        permit, so max_concurrency caps actual provider calls.
+        """
+        
+        async def attempt_once() -> InferenceResult:
+            async with self._sem:
+                return await self.generate_image_async(
+                    identity_packet,
+                    master_prompt,
+                    negative_prompt,
+                    mode,
+                    seed=seed
+                )
+        
+        pending = set()
+        result = None
+        
+        try:
+            for attempt in range(max_retries):
+                pending.add(asyncio.create_task(attempt_once()))
+                last_attempt = attempt == max_retries - 1
+                
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending,
+                        timeout=None if last_attempt else HEDGE_DELAYS[mode],
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    
+                    if not done:
+                        print(f"Attempt {attempt + 1} slow, hedging...")
+                        break
+                    
+                    for task in done:
+                        result = task.result()
+                        if result.success or result.error_code in _NON_RETRYABLE_CODES:
+                            return result
+                    
+                    if not pending:
+                        if not last_attempt:
+                            wait_time = 2 ** attempt  # Exponential backoff
+                            print(f"Attempt {attempt + 1} failed, retrying in {wait_time}s...")
+                            await asyncio.sleep(wait_time)
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        return result
+    
+    async def generate_batch_async(self, batch: List[Dict]) -> List[InferenceResult]:
+        """
+        Generate a batch of requests in one submission
+        
+        Identical fixed-seed requests (same face, prompts, mode and seed)
+        are generated once and share the result; everything else, including
+        every seed=-1 request, runs concurrently.
+        
+        Args:
+            batch: List of generate_with_retry_async keyword arguments
+        
+        Returns:
+            One InferenceResult per request, in input order
+        """
+        
+        unique: Dict[tuple, Dict] = {}
+        keys = []
+        
+        for index, request in enumerate(batch):
+            key = self._batch_key(request, index)
+            unique.setdefault(key, request)
+            keys.append(key)
+        
+        results = await asyncio.gather(*(
+            self.generate_with_retry_async(**request) for request in unique.values()
+        ))
+        results = dict(zip(unique.keys(), results))
+        
+        return [results[key] for key in keys]
+    
+    def _http(self) -> httpx.AsyncClient:
+        """Async connection pool, created on first use"""
+        
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                http2=True,
+                timeout=30,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+            )
+        return self._async_client
+    
+    def close(self):
+        """
+        Release the connection pools
+        
+        The async pool can only be closed here when no event loop is running;
+        async code should call aclose() instead.
+        """
+        self._session.close()
+        
+        if self._async_client is not None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                asyncio.run(self._async_client.aclose())
+                self._async_client = None
+            else:
+                raise RuntimeError("close() called inside an event loop; use aclose()")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    async def aclose(self):
+        """Release the sync and async connection pools"""
+        self._session.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+def _needs_harmonization(image_bytes: bytes) -> bool:
+    """
+    Cheap local check whether a generated image needs remote harmonization
+    
+    Decodes at reduced resolution (JPEG DCT scaling), resizes to 256x256 and
+    compares the Laplacian variance against HARMONIZATION_EDGE_THRESHOLD.
+    Undecodable images are sent to harmonization.
+    """
+    
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return True
+    
+    gray = cv2.resize(gray, (256, 256), interpolation=cv2.INTER_AREA)
+    edge_energy = cv2.Laplacian(gray, cv2.CV_32F).var()
+    
+    return edge_energy > HARMONIZATION_EDGE_THRESHOLD
+
+
+@functools.lru_cache(maxsize=8)
+def _client_for(
+    api_key: str,
+    provider: str = "fal",
+    model: str = "flux-schnell"
+) -> FluxPuLIDClient:
+    """Shared client per credentials, so helper calls keep a warm connection pool"""
+    return FluxPuLIDClient(api_key=api_key, provider=provider, model=model)
 
 
 # Helper function for quick usage
@@ -493,13 +1025,13 @@ def generate_identity_image(
         InferenceResult
     """
     
-    client = FluxPuLIDClient(api_key=api_key)
-    
     generation_mode = (
         GenerationMode.SPEED if mode == "speed" 
         else GenerationMode.QUALITY
     )
     
+    client = _client_for(api_key)
+    
     return client.generate_with_retry(
         identity_packet=identity_packet,
         master_prompt=master_prompt,
@@ -513,8 +1045,8 @@ if __name__ == "__main__":
     import sys
     
     # Load test data
-    with open("test_identity_packet.json", "r") as f:
-        identity_packet = json.load(f)
+    with open("test_identity_packet.json", "rb") as f:
+        identity_packet = orjson.loads(f.read())
     
     master_prompt = "A person with exact facial features from reference, standing on rainy 1920s Paris street, wearing vintage suit..."
     negative_prompt = "deformed, bad anatomy, modern clothing..."
@@ -0,0 +1,30 @@
+"""
+Image Utilities - Shared Decoding Helpers
+Used by the inference client, validation and the API server
+"""
+
+import cv2
+import numpy as np
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _TJ = TurboJPEG()
+except (ImportError, RuntimeError):
+    # PyTurboJPEG or libturbojpeg missing; decode_image falls back to OpenCV
+    _TJ = None
+
+
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    """
+    Decode encoded image bytes (JPEG/PNG/WebP) into an RGB array
+    
+    JPEG goes through libjpeg-turbo's SIMD decoder straight to RGB when
+    PyTurboJPEG is available.
+    """
+    
+    if _TJ is not None and image_bytes[:2] == b"\xff\xd8":
+        return _TJ.decode(image_bytes, pixel_format=TJPF_RGB)
+    
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    # Convert in place to avoid allocating a second full-size buffer
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
@@ -6,8 +6,237 @@ Localized denoising, texture matching, upscaling, color grading
 import cv2
 import numpy as np
 from typing import Dict, Tuple, Optional
+import threading
 import time
 
+try:
+    from numba import njit, prange
+except ImportError:
+    # Numba is optional; fall back to the NumPy kernels below
+    njit = None
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _blend_rim(image, denoised, edge_mask, rim, out):
+        """
+        Edge blend + additive rim light + clip in one pass over the image
+        
+        out = clip(image * (1 - m) + denoised * m + rim * m, 0, 255) with
+        m = edge_mask[y, x] and rim = background color * intensity.
+        """
+        h, w, c = image.shape
+        for y in prange(h):
+            for x in range(w):
+                m = edge_mask[y, x]
+                for k in range(c):
+                    # Widen before subtracting (uint8 - uint8 wraps around)
+                    p = np.float32(image[y, x, k])
+                    v = p + (np.float32(denoised[y, x, k]) - p + rim[k]) * m
+                    out[y, x, k] = np.uint8(min(max(v, 0.0), 255.0))
+    
+    # Compile at import so the first request does not pay the JIT cost
+    _warmup = np.zeros((2, 2, 3), dtype=np.uint8)
+    _blend_rim(_warmup, _warmup, np.zeros((2, 2), dtype=np.float32),
+               np.zeros(3, dtype=np.float32), np.empty_like(_warmup))
+    del _warmup
+else:
+    def _blend_rim(image, denoised, edge_mask, rim, out):
+        """Edge blend + additive rim light + clip (NumPy fallback)"""
+        m = edge_mask[:, :, np.newaxis]
+        blended = denoised.astype(np.float32)
+        blended -= image
+        blended += rim
+        blended *= m
+        blended += image
+        np.clip(blended, 0, 255, out=blended)
+        out[...] = blended
+
+
+# Luminance zone boundaries (0-255 scale) for ColorGrader LUT rows
+_SHADOW_MAX = 0.33 * 255
+_HIGHLIGHT_MIN = 0.66 * 255
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _grade_zones(image, gains, out):
+        """
+        Per-pixel zone gain: luminance, zone pick, multiply and clip in one pass
+        
+        gains rows are (highlights, midtones, shadows) as in ColorGrader.LUTS.
+        """
+        h, w, c = image.shape
+        for y in prange(h):
+            for x in range(w):
+                lum = np.float32(0.0)
+                for k in range(c):
+                    lum += np.float32(image[y, x, k])
+                lum /= c
+                
+                if lum > _HIGHLIGHT_MIN:
+                    zone = 0
+                elif lum >= _SHADOW_MAX:
+                    zone = 1
+                else:
+                    zone = 2
+                
+                for k in range(c):
+                    v = np.float32(image[y, x, k]) * gains[zone, k]
+                    out[y, x, k] = np.uint8(min(max(v, 0.0), 255.0))
+    
+    _warmup = np.zeros((2, 2, 3), dtype=np.uint8)
+    _grade_zones(_warmup, np.ones((3, 3), dtype=np.float32), np.empty_like(_warmup))
+    del _warmup
+else:
+    def _grade_zones(image, gains, out):
+        """Per-pixel zone gain via a LUT-row lookup (NumPy fallback)"""
+        lum = image.mean(axis=2, dtype=np.float32)
+        zone = 2 - (lum >= _SHADOW_MAX).astype(np.uint8) - (lum > _HIGHLIGHT_MIN)
+        graded = image * gains[zone]
+        np.clip(graded, 0, 255, out=graded)
+        out[...] = graded
+
+
+# Source for a _grade_zones variant specialized to one scene's LUT: the nine
+# gains and the zone boundaries are inlined as literals so they fold into
+# the generated code instead of being loaded per pixel (RGB input only)
+_SCENE_KERNEL_TEMPLATE = """
+def _grade_scene(image, out):
+    h, w = image.shape[0], image.shape[1]
+    for y in prange(h):
+        for x in range(w):
+            r = np.float32(image[y, x, 0])
+            g = np.float32(image[y, x, 1])
+            b = np.float32(image[y, x, 2])
+            lum = (r + g + b) * np.float32(1.0 / 3.0)
+            
+            if lum > {highlight_min!r}:
+                r *= np.float32({lut[0][0]!r}); g *= np.float32({lut[0][1]!r}); b *= np.float32({lut[0][2]!r})
+            elif lum >= {shadow_max!r}:
+                r *= np.float32({lut[1][0]!r}); g *= np.float32({lut[1][1]!r}); b *= np.float32({lut[1][2]!r})
+            else:
+                r *= np.float32({lut[2][0]!r}); g *= np.float32({lut[2][1]!r}); b *= np.float32({lut[2][2]!r})
+            
+            out[y, x, 0] = np.uint8(min(max(r, 0.0), 255.0))
+            out[y, x, 1] = np.uint8(min(max(g, 0.0), 255.0))
+            out[y, x, 2] = np.uint8(min(max(b, 0.0), 255.0))
+"""
+
+
+def _compile_scene_kernel(lut: np.ndarray):
+    """
+    Generate and compile a grading kernel for one LUT
+    
+    Args:
+        lut: 3x3 gains (highlights, midtones, shadows) x (R, G, B)
+    
+    Returns:
+        kernel(image, out) for C-contiguous uint8 RGB images
+    """
+    
+    source = _SCENE_KERNEL_TEMPLATE.format(
+        lut=lut.tolist(),
+        highlight_min=_HIGHLIGHT_MIN,
+        shadow_max=_SHADOW_MAX
+    )
+    namespace = {"np": np, "prange": prange}
+    exec(source, namespace)
+    
+    # Contiguous images only (dynamically generated code cannot use Numba's
+    # on-disk cache, so each signature is compiled again per process)
+    return njit(
+        "void(uint8[:, :, ::1], uint8[:, :, ::1])",
+        parallel=True,
+        fastmath=True
+    )(namespace["_grade_scene"])
+
+
+# Scene-specialized grading kernels, compiled on first use of each scene
+_SCENE_KERNELS: Dict[str, object] = {}
+_SCENE_KERNELS_LOCK = threading.Lock()
+
+
+def _scene_kernel(scene_type: str, lut: np.ndarray):
+    """
+    Get the grading kernel for a scene, compiling it on first request
+    
+    Args:
+        scene_type: Scene name (cache key)
+        lut: 3x3 gains for the scene
+    
+    Returns:
+        kernel(image, out) for C-contiguous uint8 RGB images
+    """
+    
+    kernel = _SCENE_KERNELS.get(scene_type)
+    if kernel is None:
+        with _SCENE_KERNELS_LOCK:
+            kernel = _SCENE_KERNELS.get(scene_type)
+            if kernel is None:
+                kernel = _SCENE_KERNELS[scene_type] = _compile_scene_kernel(lut)
+    
+    return kernel
+
+
+# Std of the grain kernel's raw noise (a + b - c - d over 16-bit uniforms)
+_GRAIN_STD = 65536.0 / np.sqrt(3.0)
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _add_grain(image, face_mask, sigma, seed, out):
+        """
+        Add face-masked grain with std sigma * mask * 0.5, saturating to uint8
+        
+        Each sample is the sum of two minus two 16-bit uniforms (close to
+        Gaussian) from a per-row splitmix64 stream, so rows run in parallel
+        without a shared generator.
+        """
+        h, w, c = image.shape
+        golden = np.uint64(0x9E3779B97F4A7C15)
+        mask16 = np.uint64(0xFFFF)
+        scale = sigma * 0.5 / _GRAIN_STD
+        
+        for y in prange(h):
+            state = np.uint64(seed) ^ (np.uint64(y) * golden)
+            for x in range(w):
+                m = face_mask[y, x] * scale
+                for k in range(c):
+                    if m == 0.0:
+                        out[y, x, k] = image[y, x, k]
+                        continue
+                    
+                    state += golden
+                    z = state
+                    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+                    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+                    z ^= z >> np.uint64(31)
+                    
+                    noise = (np.float32(z & mask16) + np.float32((z >> np.uint64(16)) & mask16)
+                             - np.float32((z >> np.uint64(32)) & mask16)
+                             - np.float32((z >> np.uint64(48)) & mask16))
+                    v = np.float32(image[y, x, k]) + noise * m
+                    out[y, x, k] = np.uint8(min(max(v, 0.0), 255.0))
+    
+    _warmup = np.zeros((2, 2, 3), dtype=np.uint8)
+    _add_grain(_warmup, np.ones((2, 2)), 1.0, 1, np.empty_like(_warmup))
+    del _warmup
+else:
+    def _add_grain(image, face_mask, sigma, seed, out):
+        """Add face-masked grain with std sigma * mask * 0.5 (NumPy fallback)"""
+        noise = np.random.default_rng(seed).standard_normal(image.shape, dtype=np.float32)
+        noise *= (face_mask * (sigma * 0.5)).astype(np.float32)[:, :, np.newaxis]
+        noise += image
+        np.clip(noise, 0, 255, out=noise)
+        out[...] = noise
+
+
+# Scene keywords in priority order (the first scene with any hit wins)
+_SCENE_KEYWORDS = {
+    "mars": ("mars", "desert", "sunset", "warm"),
+    "night": ("night", "evening", "moonlight", "neon"),
+    "vintage": ("vintage", "retro", "film", "1920")
+}
+
 
 class RefinementProcessor:
     """
@@ -26,6 +255,7 @@ class RefinementProcessor:
         self.upscale_factor = upscale_factor
         self.enable_upscale = enable_upscale
         self.color_grader = ColorGrader()
+        self._sharpen_kernel = self._build_sharpen_kernel(upscale_factor)
         
         # Load upscaler if enabled
         if self.enable_upscale:
@@ -63,16 +293,22 @@ class RefinementProcessor:
         
         # Stage 1: Localized Harmonization (2-3s)
         print("  Stage 1/4: Localized Harmonization...")
-        edge_mask = self._create_edge_mask(flux_output)
+        edge_mask = self._create_edge_mask(cv2.cvtColor(flux_output, cv2.COLOR_RGB2GRAY))
         harmonized = self._localized_denoise(flux_output, edge_mask, denoise_strength)
-        harmonized = self._apply_rim_light(harmonized, flux_output, edge_mask)
         
         # Stage 2: Texture Matching (1-2s)
+        # Each distinct image is converted to grayscale once
         print("  Stage 2/4: Texture Matching...")
-        ref_profile = self._analyze_grain(reference_image)
+        ref_gray = cv2.cvtColor(reference_image, cv2.COLOR_RGB2GRAY)
+        harmonized_gray = cv2.cvtColor(harmonized, cv2.COLOR_RGB2GRAY)
+        ref_profile = self._analyze_grain(ref_gray)
         face_mask = self._extract_face_region(reference_image)
-        textured = self._match_grain(harmonized, ref_profile, face_mask)
-        textured = self._match_sharpness(textured, reference_image, face_mask)
+        textured = self._match_grain(harmonized, harmonized_gray, ref_profile, face_mask)
+        textured_gray = (
+            harmonized_gray if textured is harmonized
+            else cv2.cvtColor(textured, cv2.COLOR_RGB2GRAY)
+        )
+        textured = self._match_sharpness(textured, textured_gray, ref_gray, face_mask)
         
         # Stage 3: Super-Resolution (3-4s)
         if self.enable_upscale:
@@ -101,11 +337,8 @@ class RefinementProcessor:
         
         return graded, metrics
     
-    def _create_edge_mask(self, image: np.ndarray) -> np.ndarray:
-        """Create mask for selective denoising at edges"""
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    def _create_edge_mask(self, gray: np.ndarray) -> np.ndarray:
+        """Create mask for selective denoising at edges (from the grayscale image)"""
         
         # Detect edges
         edges = cv2.Canny(gray, threshold1=50, threshold2=150)
@@ -118,7 +351,7 @@ class RefinementProcessor:
         edge_mask = cv2.GaussianBlur(dilated, (21, 21), 0)
         
         # Normalize to 0-1
-        edge_mask = edge_mask.astype(float) / 255.0
+        edge_mask = edge_mask.astype(np.float32) / 255.0
         
         return edge_mask
     
@@ -126,11 +359,15 @@ class RefinementProcessor:
         self,
         image: np.ndarray,
         edge_mask: np.ndarray,
-        strength: float
+        strength: float,
+        rim_intensity: float = 0.3
     ) -> np.ndarray:
         """
-        Apply denoising only to edge regions
+        Apply denoising and rim lighting only to edge regions
         Simulates img2img at edges without full API call
+        
+        The blend, rim light (based on the image's dominant color) and clip
+        run as a single fused pass.
         """
         
         # Use bilateral filter for edge smoothing
@@ -141,45 +378,16 @@ class RefinementProcessor:
             sigmaSpace=int(strength * 150)
         )
         
-        # Blend original and denoised using edge mask
-        harmonized = (
-            image * (1 - edge_mask[:, :, np.newaxis]) +
-            denoised * edge_mask[:, :, np.newaxis]
-        )
+        # Dominant background color as the rim light, applied only at edges
+        rim = (np.asarray(cv2.mean(image)[:3]) * rim_intensity).astype(np.float32)
         
-        return harmonized.astype(np.uint8)
-    
-    def _apply_rim_light(
-        self,
-        image: np.ndarray,
-        background: np.ndarray,
-        edge_mask: np.ndarray,
-        intensity: float = 0.3
-    ) -> np.ndarray:
-        """Apply rim lighting based on background illumination"""
-        
-        # Calculate dominant background color
-        bg_color = np.mean(background, axis=(0, 1))
-        
-        # Create rim light layer
-        rim_light = np.ones_like(image) * bg_color
-        
-        # Apply only at edges with intensity
-        rim_mask = edge_mask * intensity
+        harmonized = np.empty_like(image)
+        _blend_rim(image, denoised, edge_mask.astype(np.float32, copy=False), rim, harmonized)
         
-        # Additive blending
-        lit_image = image.astype(float) + (rim_light * rim_mask[:, :, np.newaxis])
-        
-        # Clip to valid range
-        lit_image = np.clip(lit_image, 0, 255)
-        
-        return lit_image.astype(np.uint8)
+        return harmonized
     
-    def _analyze_grain(self, image: np.ndarray) -> Dict:
-        """Analyze image grain/noise characteristics"""
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    def _analyze_grain(self, gray: np.ndarray) -> Dict:
+        """Analyze image grain/noise characteristics (from the grayscale image)"""
         
         # High-pass filter to isolate grain
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
@@ -214,38 +422,37 @@ class RefinementProcessor:
     def _match_grain(
         self,
         generated: np.ndarray,
+        generated_gray: np.ndarray,
         reference_profile: Dict,
         face_region: np.ndarray
     ) -> np.ndarray:
         """Match generated image grain to reference"""
         
         # Analyze current grain
-        current_profile = self._analyze_grain(generated)
+        current_profile = self._analyze_grain(generated_gray)
         
         # Calculate adjustment needed
         grain_diff = reference_profile["std"] - current_profile["std"]
         
         # Add slight grain if needed
         if abs(grain_diff) > 2:
-            noise = np.random.normal(0, abs(grain_diff), generated.shape)
-            adjusted = generated.astype(float) + (noise * face_region[:, :, np.newaxis] * 0.5)
-            adjusted = np.clip(adjusted, 0, 255)
-            return adjusted.astype(np.uint8)
+            adjusted = np.empty_like(generated)
+            seed = int(np.random.randint(0, 2**31 - 1))
+            _add_grain(generated, face_region, abs(grain_diff), seed, adjusted)
+            return adjusted
         
         return generated
     
     def _match_sharpness(
         self,
         generated: np.ndarray,
-        reference: np.ndarray,
+        gen_gray: np.ndarray,
+        ref_gray: np.ndarray,
         face_region: np.ndarray
     ) -> np.ndarray:
-        """Match face sharpness to reference photo"""
+        """Match face sharpness to reference photo (grayscale images passed in)"""
         
         # Measure sharpness (Laplacian variance)
-        ref_gray = cv2.cvtColor(reference, cv2.COLOR_RGB2GRAY)
-        gen_gray = cv2.cvtColor(generated, cv2.COLOR_RGB2GRAY)
-        
         ref_sharpness = cv2.Laplacian(ref_gray, cv2.CV_64F).var()
         gen_sharpness = cv2.Laplacian(gen_gray, cv2.CV_64F).var()
         
@@ -279,35 +486,49 @@ class RefinementProcessor:
             h, w = image.shape[:2]
             new_h, new_w = h * self.upscale_factor, w * self.upscale_factor
             
-            upscaled = cv2.resize(
-                image,
+            # Unsharp mask for clarity, applied before the resize where it
+            # touches 1/factor^2 of the pixels (saturating uint8 output)
+            sharpened = cv2.filter2D(image, -1, self._sharpen_kernel)
+            
+            return cv2.resize(
+                sharpened,
                 (new_w, new_h),
                 interpolation=cv2.INTER_CUBIC
             )
             
-            # Apply unsharp mask for clarity
-            gaussian = cv2.GaussianBlur(upscaled, (0, 0), 2.0)
-            upscaled = cv2.addWeighted(upscaled, 1.5, gaussian, -0.5, 0)
-            
-            return np.clip(upscaled, 0, 255).astype(np.uint8)
-            
         except Exception as e:
             print(f"⚠️  Upscaling failed: {e}, returning original")
             return image
     
+    @staticmethod
+    def _build_sharpen_kernel(upscale_factor: int) -> np.ndarray:
+        """
+        Single-pass unsharp mask kernel: 1.5 * identity - 0.5 * Gaussian
+        
+        Sigma 2.0 at output resolution corresponds to 2.0 / upscale_factor
+        at input resolution.
+        """
+        
+        sigma = 2.0 / upscale_factor
+        ksize = 2 * int(np.ceil(3 * sigma)) + 1
+        gaussian = cv2.getGaussianKernel(ksize, sigma)
+        
+        kernel = -0.5 * (gaussian @ gaussian.T)
+        kernel[ksize // 2, ksize // 2] += 1.5
+        
+        return kernel.astype(np.float32)
+    
     def _detect_scene_type(self, prompt: str) -> str:
         """Auto-detect scene type from prompt"""
         
         prompt_lower = prompt.lower()
         
-        if any(word in prompt_lower for word in ["mars", "desert", "sunset", "warm"]):
-            return "mars"
-        elif any(word in prompt_lower for word in ["night", "evening", "moonlight", "neon"]):
-            return "night"
-        elif any(word in prompt_lower for word in ["vintage", "retro", "film", "1920"]):
-            return "vintage"
-        else:
-            return "neutral"
+        for scene, keywords in _SCENE_KEYWORDS.items():
+            for word in keywords:
+                if word in prompt_lower:
+                    return scene
+        
+        return "neutral"
     
     def _load_upsampler(self):
         """Load Real-ESRGAN model (placeholder)"""
@@ -342,6 +563,14 @@ class ColorGrader:
         ])
     }
     
+    def __init__(self):
+        # float32 gain tables; identity LUTs (neutral) are skipped entirely
+        self._gains = {
+            scene: lut.astype(np.float32)
+            for scene, lut in self.LUTS.items()
+            if not np.all(lut == 1.0)
+        }
+    
     def apply_lut(self, image: np.ndarray, scene_type: str = "neutral") -> np.ndarray:
         """
         Apply color grading LUT
@@ -351,33 +580,22 @@ class ColorGrader:
             scene_type: Scene type (mars, night, vintage, neutral)
         
         Returns:
-            graded: Color-graded image
+            graded: Color-graded image (the input itself for neutral/unknown scenes)
         """
         
-        lut = self.LUTS.get(scene_type, self.LUTS["neutral"])
-        
-        # Normalize image to 0-1
-        img = image.astype(float) / 255.0
-        
-        # Separate luminance zones
-        luminance = np.mean(img, axis=2)
-        
-        highlights = (luminance > 0.66).astype(float)[:, :, np.newaxis]
-        midtones = ((luminance >= 0.33) & (luminance <= 0.66)).astype(float)[:, :, np.newaxis]
-        shadows = (luminance < 0.33).astype(float)[:, :, np.newaxis]
-        
-        # Apply LUT
-        graded = (
-            img * lut[0] * highlights +
-            img * lut[1] * midtones +
-            img * lut[2] * shadows
-        )
+        gains = self._gains.get(scene_type)
+        if gains is None:
+            return image
         
-        # Normalize masks
-        total_mask = highlights + midtones + shadows
-        graded = graded / (total_mask + 1e-6)
+        # Luminance zones (highlights / midtones / shadows) partition the
+        # pixels, so each pixel takes exactly one LUT row
+        graded = np.empty_like(image)
         
-        # Convert back to 0-255
-        graded = np.clip(graded * 255, 0, 255).astype(np.uint8)
+        if (njit is not None and image.dtype == np.uint8 and image.ndim == 3
+                and image.shape[2] == 3 and image.flags.c_contiguous):
+            _scene_kernel(scene_type, gains)(image, graded)
+        else:
+            _grade_zones(image, gains, graded)
         
         return graded
+
@@ -0,0 +1,49 @@
+"""
+Unit tests for FluxPuLIDClient batching (no network)
+"""
+
+import asyncio
+
+from flux_api_client import FluxPuLIDClient, InferenceResult
+
+
+def _batch_item(seed: int) -> dict:
+    return {
+        "identity_packet": {"image": {"cleanFace": "face"}},
+        "master_prompt": "portrait",
+        "negative_prompt": "blurry",
+        "seed": seed
+    }
+
+
+def _counting_client() -> tuple:
+    client = FluxPuLIDClient(api_key="test")
+    calls = []
+
+    async def fake_generate(**request):
+        calls.append(request)
+        return InferenceResult(success=True, image_url=f"https://cdn/{len(calls)}")
+
+    client.generate_with_retry_async = fake_generate
+    return client, calls
+
+
+def test_random_seed_items_are_not_merged():
+    client, calls = _counting_client()
+
+    results = asyncio.run(client.generate_batch_async([_batch_item(-1)] * 3))
+
+    assert len(calls) == 3
+    assert len({result.image_url for result in results}) == 3
+
+
+def test_identical_fixed_seed_items_are_merged():
+    client, calls = _counting_client()
+
+    results = asyncio.run(client.generate_batch_async(
+        [_batch_item(7), _batch_item(7), _batch_item(8)]
+    ))
+
+    assert len(calls) == 2
+    assert results[0] is results[1]
+    assert results[2] is not results[0]
@@ -0,0 +1,49 @@
+"""
+Unit tests for validation_module helpers (no face models needed)
+"""
+
+import numpy as np
+
+from validation_module import DataPurgeProtocol, _crop_to_box
+
+
+IMAGE = np.zeros((400, 200, 3), dtype=np.uint8)  # h=400, w=200
+
+
+def test_crop_normalized_box():
+    box = {"left": 0.25, "top": 0.1, "right": 0.75, "bottom": 0.6}
+
+    crop = _crop_to_box(IMAGE, box)
+
+    assert crop.shape == (200, 100, 3)
+    assert np.shares_memory(crop, IMAGE)
+
+
+def test_crop_normalized_box_is_clamped():
+    crop = _crop_to_box(IMAGE, {"left": -0.1, "top": 0.5, "right": 1.2, "bottom": 1.0})
+
+    assert crop.shape == (200, 200, 3)
+
+
+def test_crop_pixel_box_fallback():
+    crop = _crop_to_box(IMAGE, {"x": 20, "y": 40, "width": 100, "height": 150})
+
+    assert crop.shape == (150, 100, 3)
+
+
+def test_unusable_boxes_return_none():
+    assert _crop_to_box(IMAGE, None) is None
+    assert _crop_to_box(IMAGE, {"left": 0.5, "top": 0.5}) is None
+    assert _crop_to_box(IMAGE, {"left": 0.5, "top": 0.5, "right": 0.55, "bottom": 0.55}) is None
+    assert _crop_to_box(IMAGE, {"x": "?", "y": 0, "width": 10, "height": 10}) is None
+
+
+def test_purge_removes_only_this_session(tmp_path):
+    for name in ("abc_embedding.pkl", "abc_temp.jpg", "abc_2_temp.jpg", "abc1_temp.jpg"):
+        (tmp_path / name).touch()
+    (tmp_path / "abc_cache" / "faces").mkdir(parents=True)
+
+    DataPurgeProtocol.purge_embeddings(str(tmp_path), "abc")
+    DataPurgeProtocol.purge_embeddings(str(tmp_path / "missing"), "abc")
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["abc1_temp.jpg", "abc_2_temp.jpg"]
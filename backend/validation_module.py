@@ -5,9 +5,134 @@ Face similarity, quality metrics, ethical AI compliance
 
 import cv2
 import numpy as np
-from typing import Dict, Tuple, Optional
-from deepface import DeepFace
+from typing import Callable, Dict, List, Tuple, Optional
+from cachetools import TTLCache
+import base64
+import hashlib
 import os
+import threading
+
+from image_utils import decode_image
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# DeepFace pulls in TensorFlow (seconds, hundreds of MB); imported on first use
+_DEEPFACE = None
+
+
+def _lazy_deepface():
+    """Import DeepFace on first use"""
+    global _DEEPFACE
+    if _DEEPFACE is None:
+        from deepface import DeepFace
+        _DEEPFACE = DeepFace
+    return _DEEPFACE
+
+
+# BRISQUE model files ship with opencv_contrib (samples/data/quality)
+BRISQUE_MODEL_PATH = os.getenv("BRISQUE_MODEL_PATH", "brisque_model_live.yml")
+BRISQUE_RANGE_PATH = os.getenv("BRISQUE_RANGE_PATH", "brisque_range_live.yml")
+
+# Shared scorer: the SVM model is parsed once, compute() is serialized
+_BRISQUE = None
+_BRISQUE_LOCK = threading.Lock()
+
+
+def _get_brisque():
+    """BRISQUE scorer, created on first use (None if unavailable)"""
+    global _BRISQUE
+    if _BRISQUE is None:
+        try:
+            _BRISQUE = cv2.quality.QualityBRISQUE_create(BRISQUE_MODEL_PATH, BRISQUE_RANGE_PATH)
+        except (AttributeError, cv2.error) as e:
+            # Needs opencv-contrib and the model files; don't retry every call
+            print(f"⚠️  BRISQUE unavailable, using variance fallback: {e}")
+            _BRISQUE = False
+    return _BRISQUE or None
+
+
+# ArcFace exported to ONNX (e.g. insightface arcface_r100.onnx); empty keeps the
+# DeepFace Keras model. Faces are still detected and aligned by DeepFace.
+ARCFACE_ONNX_PATH = os.getenv("ARCFACE_ONNX_PATH", "")
+
+# Tried in order, filtered by what the installed onnxruntime build supports
+_ONNX_PROVIDERS = ("TensorrtExecutionProvider", "CUDAExecutionProvider", "CPUExecutionProvider")
+
+# insightface ArcFace input normalization: (pixel - 127.5) / 127.5, NCHW
+_ARCFACE_MEAN = 127.5
+_ARCFACE_STD = 127.5
+
+
+def _load_onnx_session(path: str):
+    """ONNX Runtime session on the fastest available execution provider"""
+    
+    available = ort.get_available_providers()
+    providers = [p for p in _ONNX_PROVIDERS if p in available]
+    return ort.InferenceSession(path, providers=providers)
+
+
+def quantize_arcface_onnx(src_path: str, dst_path: str) -> str:
+    """
+    Write an INT8 (dynamic weight quantization) copy of an ArcFace ONNX model
+    
+    Point ARCFACE_ONNX_PATH at the result: ~4x smaller weights and faster
+    CPU inference on VNNI / dot-product hardware. Re-check
+    SIMILARITY_THRESHOLD on known pairs after switching.
+    
+    Args:
+        src_path: FP32 ONNX model
+        dst_path: Output path for the INT8 model
+    
+    Returns:
+        dst_path
+    """
+    
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    
+    quantize_dynamic(src_path, dst_path, weight_type=QuantType.QInt8)
+    return dst_path
+
+
+def _crop_to_box(image: np.ndarray, box: Optional[Dict], min_size: int = 32) -> Optional[np.ndarray]:
+    """
+    Crop to an identity packet boundingBox
+    
+    The Android client sends a NormalizedBoundingBox {left, top, right,
+    bottom} in 0-1 image fractions; a pixel box {x, y, width, height} is
+    accepted as a fallback.
+    
+    Returns:
+        Face crop (view), or None if the box is missing or unusable
+    """
+    
+    if not box:
+        return None
+    
+    h, w = image.shape[:2]
+    try:
+        if "left" in box:
+            x0 = int(float(box["left"]) * w)
+            y0 = int(float(box["top"]) * h)
+            x1 = int(round(float(box["right"]) * w))
+            y1 = int(round(float(box["bottom"]) * h))
+        else:
+            x0 = int(box["x"])
+            y0 = int(box["y"])
+            x1 = int(box["x"] + box["width"])
+            y1 = int(box["y"] + box["height"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    
+    x0, y0 = max(0, x0), max(0, y0)
+    x1, y1 = min(w, x1), min(h, y1)
+    
+    if x1 - x0 < min_size or y1 - y0 < min_size:
+        return None
+    
+    return image[y0:y1, x0:x1]
 
 
 class IdentityValidator:
@@ -16,20 +141,65 @@ class IdentityValidator:
     """
     
     SIMILARITY_THRESHOLD = 0.80  # 80% minimum similarity
+    DETECTOR_BACKEND = "opencv"
     
-    def __init__(self, model_name="ArcFace"):
+    # Reference embeddings are biometric data: keep them briefly
+    EMBEDDING_CACHE_TTL = 600
+    
+    SSIM_SIZE = 256  # Fallback SSIM working resolution
+    EXACT_SSIM = False  # Windowed skimage SSIM instead of the global form
+    
+    def __init__(self, model_name="ArcFace", preload=True, use_ssim_fallback=False):
         """
         Initialize validator
         
         Args:
             model_name: Face recognition model (ArcFace, Facenet, VGG-Face)
+            preload: Load model weights now instead of on first validate()
+            use_ssim_fallback: Score with SSIM when face comparison fails
+                (otherwise the score is 0.0 and the metrics are flagged)
         """
         self.model_name = model_name
+        self.use_ssim_fallback = use_ssim_fallback
+        
+        # Reference face embeddings by content hash (retries and repeat
+        # generations for the same user skip the CNN forward pass)
+        self._embedding_cache = TTLCache(maxsize=256, ttl=self.EMBEDDING_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+        
+        # ONNX Runtime ArcFace when configured, DeepFace Keras model otherwise
+        self._use_onnx = bool(ARCFACE_ONNX_PATH) and model_name == "ArcFace"
+        if self._use_onnx and ort is None:
+            print("⚠️  ARCFACE_ONNX_PATH set but onnxruntime is not installed, using DeepFace")
+            self._use_onnx = False
+        
+        self._model = None
+        self._session = None
+        if preload:
+            self.preload()
+    
+    def preload(self):
+        """
+        Load recognition and detector weights (DeepFace caches them
+        process-wide) so the first validate() does not pay the ~5s
+        cold start
+        """
+        
+        try:
+            _lazy_deepface()
+            from deepface.detectors import FaceDetector
+            
+            FaceDetector.build_model(self.DETECTOR_BACKEND)
+            self._load_recognizer()
+        except Exception as e:
+            # Weights unavailable (e.g. offline); validate() retries the load
+            print(f"⚠️  Could not preload {self.model_name}: {e}")
     
     def validate(
         self,
         reference_image: np.ndarray,
-        generated_image: np.ndarray
+        generated_image: np.ndarray,
+        reference_box: Optional[Dict] = None
     ) -> Tuple[bool, Dict]:
         """
         Validate identity preservation
@@ -37,6 +207,8 @@ class IdentityValidator:
         Args:
             reference_image: Original user photo
             generated_image: AI-generated image
+            reference_box: facialData.boundingBox of the reference photo;
+                when usable, the face detector is skipped for it
         
         Returns:
             is_valid: True if similarity > threshold
@@ -47,9 +219,10 @@ class IdentityValidator:
         
         try:
             # Calculate face similarity
-            similarity_score = self._calculate_similarity(
+            similarity_score, fallback_reason = self._calculate_similarity(
                 reference_image,
-                generated_image
+                generated_image,
+                reference_box
             )
             
             # Check threshold
@@ -64,6 +237,10 @@ class IdentityValidator:
                 "recommendation": self._get_recommendation(similarity_score)
             }
             
+            if fallback_reason is not None:
+                metrics["fallback"] = True
+                metrics["reason"] = fallback_reason
+            
             if is_valid:
                 print(f"✅ Identity Preserved: {similarity_score:.2%}")
             else:
@@ -81,43 +258,133 @@ class IdentityValidator:
     def _calculate_similarity(
         self,
         image1: np.ndarray,
-        image2: np.ndarray
-    ) -> float:
+        image2: np.ndarray,
+        box1: Optional[Dict] = None
+    ) -> Tuple[float, Optional[str]]:
         """
-        Calculate face similarity using DeepFace
+        Calculate face similarity using DeepFace embeddings
+        
+        Args:
+            image1: Reference image (embeddings cached by content)
+            image2: Generated image
+            box1: Known face box in image1 (optional)
         
         Returns:
             similarity: 0-1 score (1 = perfect match)
+            fallback_reason: Why face comparison failed (None on success)
         """
         
         try:
-            # DeepFace verification
-            result = DeepFace.verify(
-                img1_path=image1,
-                img2_path=image2,
-                model_name=self.model_name,
-                enforce_detection=False,
-                detector_backend="opencv"
-            )
+            # A known face box replaces detection: embed the crop directly
+            crop1 = _crop_to_box(image1, box1)
             
-            # Convert distance to similarity
-            distance = result["distance"]
+            key = self._embedding_key(image1 if crop1 is None else crop1)
+            with self._cache_lock:
+                embeddings1 = self._embedding_cache.get(key)
+            
+            # Embed both images in one forward pass unless the reference is cached
+            if embeddings1 is None:
+                embeddings1, embeddings2 = self._embed(
+                    [image1 if crop1 is None else crop1, image2],
+                    detect=[crop1 is None, True]
+                )
+                with self._cache_lock:
+                    self._embedding_cache[key] = embeddings1
+            else:
+                (embeddings2,) = self._embed([image2])
+            
+            # Embeddings are unit-length: cosine similarity is a bare dot
+            # product. Take the closest face pair (as DeepFace.verify)
+            cos_sim = float((embeddings1 @ embeddings2.T).max())
+            
+            distance = 1.0 - cos_sim
             
             # ArcFace distance threshold is ~0.68
-            # Convert to 0-1 similarity scale
+            # Convert to 0-1 similarity scale (0.80 threshold = cosine ~0.73 for ArcFace)
             if self.model_name == "ArcFace":
                 similarity = 1 - (distance / 1.34)  # Normalize
             else:
                 similarity = 1 - (distance / 1.5)
             
-            similarity = max(0, min(1, similarity))
+            similarity = max(0.0, min(1.0, float(similarity)))
             
-            return similarity
+            return similarity, None
             
-        except Exception as e:
+        except (ValueError, OSError, cv2.error) as e:
+            # Unreadable image / no usable face; anything else is a real failure
             print(f"Face comparison failed: {e}")
-            # Fallback to SSIM
-            return self._fallback_similarity(image1, image2)
+            
+            # SSIM is not an identity measure: only on explicit opt-in
+            if self.use_ssim_fallback:
+                return self._fallback_similarity(image1, image2), str(e)
+            return 0.0, str(e)
+    
+    def _load_recognizer(self):
+        """Load the face recognition model (ONNX session or Keras model)"""
+        
+        if self._use_onnx:
+            self._session = _load_onnx_session(ARCFACE_ONNX_PATH)
+            print(f"✓ ArcFace ONNX on {self._session.get_providers()[0]}")
+        else:
+            self._model = _lazy_deepface().build_model(self.model_name)
+    
+    def _embedding_key(self, image: np.ndarray) -> Tuple[str, str]:
+        """Cache key for an image's embeddings (model + content hash)"""
+        
+        digest = hashlib.blake2b(np.ascontiguousarray(image), digest_size=16)
+        digest.update(repr(image.shape).encode())
+        return self.model_name, digest.hexdigest()
+    
+    def _embed(
+        self,
+        images: List[np.ndarray],
+        detect: Optional[List[bool]] = None
+    ) -> List[np.ndarray]:
+        """
+        Detect, align and embed faces of several images in a single batch
+        
+        Args:
+            images: Images to embed
+            detect: Per image, False if it is already a face crop (default: all True)
+        
+        Returns:
+            L2-normalized float32 embeddings per image, one row per detected face
+        """
+        
+        from deepface.commons import functions
+        
+        if self._model is None and self._session is None:
+            self._load_recognizer()
+        
+        target_size = functions.find_target_size(model_name=self.model_name)
+        
+        # Same preprocessing as DeepFace.represent (base normalization is a no-op)
+        crops = []
+        counts = []
+        for image, run_detector in zip(images, detect or [True] * len(images)):
+            faces = functions.extract_faces(
+                img=image,
+                target_size=target_size,
+                detector_backend=self.DETECTOR_BACKEND if run_detector else "skip",
+                grayscale=False,
+                enforce_detection=False,
+                align=run_detector
+            )
+            crops.extend(face for face, _, _ in faces)
+            counts.append(len(faces))
+        
+        batch = np.concatenate(crops)
+        if self._session is not None:
+            # Crops are float [0, 1] NHWC
+            blob = (batch.transpose(0, 3, 1, 2) * 255.0 - _ARCFACE_MEAN) / _ARCFACE_STD
+            input_name = self._session.get_inputs()[0].name
+            embeddings = self._session.run(None, {input_name: blob.astype(np.float32)})[0]
+        else:
+            embeddings = self._model.predict(batch, verbose=0).astype(np.float32)
+        
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        
+        return np.split(embeddings, np.cumsum(counts)[:-1])
     
     def _fallback_similarity(
         self,
@@ -126,20 +393,50 @@ class IdentityValidator:
     ) -> float:
         """Fallback to SSIM if face detection fails"""
         
-        from skimage.metrics import structural_similarity as ssim
-        
         # Convert to grayscale
         gray1 = cv2.cvtColor(image1, cv2.COLOR_RGB2GRAY)
         gray2 = cv2.cvtColor(image2, cv2.COLOR_RGB2GRAY)
         
-        # Resize to same size
-        h, w = gray1.shape
-        gray2 = cv2.resize(gray2, (w, h))
+        # Compare at a fixed low resolution: SSIM only needs local
+        # statistics, and a full-res sliding window is memory-bound
+        size = (self.SSIM_SIZE, self.SSIM_SIZE)
+        gray1 = cv2.resize(gray1, size, interpolation=cv2.INTER_AREA)
+        gray2 = cv2.resize(gray2, size, interpolation=cv2.INTER_AREA)
         
-        # Calculate SSIM
-        score = ssim(gray1, gray2)
+        if self.EXACT_SSIM:
+            from skimage.metrics import structural_similarity as ssim
+            
+            # Calculate SSIM (Wang et al. Gaussian-weighted form)
+            score = ssim(
+                gray1,
+                gray2,
+                gaussian_weights=True,
+                sigma=1.5,
+                use_sample_covariance=False,
+                data_range=255
+            )
+            
+            return float(score)
         
-        return score
+        # Global SSIM: after mean subtraction the contrast-structure term
+        # is (2·x1ᵀx2 + c) / (‖x1‖² + ‖x2‖² + c), one dot product each
+        x1 = gray1.ravel().astype(np.float32)
+        x2 = gray2.ravel().astype(np.float32)
+        mu1 = float(x1.mean())
+        mu2 = float(x2.mean())
+        x1 -= mu1
+        x2 -= mu2
+        
+        q = x1.size
+        c1 = (0.01 * 255) ** 2
+        c2 = (q - 1) * (0.03 * 255) ** 2
+        
+        luminance = (2 * mu1 * mu2 + c1) / (mu1 * mu1 + mu2 * mu2 + c1)
+        structure = (2 * float(np.dot(x1, x2)) + c2) / (
+            float(np.dot(x1, x1)) + float(np.dot(x2, x2)) + c2
+        )
+        
+        return float(luminance * structure)
     
     def _get_recommendation(self, similarity: float) -> str:
         """Get user-friendly recommendation"""
@@ -160,79 +457,161 @@ class QualityMetrics:
     """
     
     @staticmethod
-    def calculate_brisque(image: np.ndarray) -> float:
+    def calculate_brisque(image: np.ndarray, gray: Optional[np.ndarray] = None) -> float:
         """
         Calculate BRISQUE (no-reference quality)
         
+        Args:
+            image: RGB image
+            gray: Precomputed grayscale of image (optional)
+        
         Returns:
             score: 0-100 (lower = better quality)
         """
         
         try:
-            import cv2
-            brisque = cv2.quality.QualityBRISQUE_create()
-            score = brisque.compute(image)[0]
+            with _BRISQUE_LOCK:
+                score = _get_brisque().compute(image)[0]
             return float(score)
         except:
             # Fallback: use variance as quality indicator
-            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            variance = np.var(gray)
+            if gray is None:
+                gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            _, stddev = cv2.meanStdDev(gray)
+            variance = float(stddev[0, 0]) ** 2
             # Normalize to 0-100 scale
             score = 100 - min(100, variance / 10)
-            return score
+            return float(score)
     
     @staticmethod
-    def calculate_sharpness(image: np.ndarray) -> float:
+    def calculate_sharpness(image: np.ndarray, gray: Optional[np.ndarray] = None) -> float:
         """
         Calculate image sharpness (Laplacian variance)
         
+        Args:
+            image: RGB image
+            gray: Precomputed grayscale of image (optional)
+        
         Returns:
             sharpness: Higher = sharper
         """
         
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        sharpness = laplacian.var()
-        return float(sharpness)
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        # 3x3 aperture Laplacian of uint8 fits in int16
+        laplacian = cv2.Laplacian(gray, cv2.CV_16S)
+        _, stddev = cv2.meanStdDev(laplacian)
+        sharpness = float(stddev[0, 0]) ** 2
+        return sharpness
     
     @staticmethod
-    def calculate_edge_smoothness(image: np.ndarray) -> float:
+    def calculate_edge_smoothness(image: np.ndarray, gray: Optional[np.ndarray] = None) -> float:
         """
         Measure edge smoothness (less "pasted" look)
         
+        Args:
+            image: RGB image
+            gray: Precomputed grayscale of image (optional)
+        
         Returns:
             smoothness: 0-1 (higher = smoother)
         """
         
         # Detect edges
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
         edges = cv2.Canny(gray, 50, 150)
         
-        # Count harsh edges
-        harsh_edges = np.sum(edges > 200)
-        total_pixels = edges.size
+        # Count harsh edges (Canny output is binary 0/255)
+        harsh_edges = cv2.countNonZero(edges)
+        total_pixels = edges.shape[0] * edges.shape[1]
         
-        # Smoothness = fewer harsh edges
-        smoothness = 1 - (harsh_edges / total_pixels)
+        # Smoothness = fewer harsh edges (int / int is already a Python float)
+        smoothness = 1.0 - harsh_edges / total_pixels
         
-        return float(smoothness)
+        return smoothness
     
     @staticmethod
     def calculate_all(image: np.ndarray) -> Dict:
         """Calculate all quality metrics"""
         
+        # One grayscale conversion shared by every metric
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        
         return {
-            "brisque_score": QualityMetrics.calculate_brisque(image),
-            "sharpness": QualityMetrics.calculate_sharpness(image),
-            "edge_smoothness": QualityMetrics.calculate_edge_smoothness(image)
+            "brisque_score": QualityMetrics.calculate_brisque(image, gray),
+            "sharpness": QualityMetrics.calculate_sharpness(image, gray),
+            "edge_smoothness": QualityMetrics.calculate_edge_smoothness(image, gray)
         }
 
 
+class IdentityImageCache:
+    """
+    Decoded reference photos keyed by the identity packet's image content
+    
+    Retries and SPEED/QUALITY re-generations of the same capture skip the
+    base64 + JPEG decode. Entries are face data, so they expire quickly.
+    """
+    
+    def __init__(
+        self,
+        decoder: Callable[[bytes], np.ndarray] = decode_image,
+        max_mb: int = 64,
+        ttl: float = 600
+    ):
+        """
+        Args:
+            decoder: Encoded image bytes -> RGB array
+            max_mb: Memory budget for decoded images
+            ttl: Seconds an entry is kept
+        """
+        self._decode = decoder
+        self._cache = TTLCache(maxsize=max_mb * 1024 * 1024, ttl=ttl, getsizeof=lambda a: a.nbytes)
+        self._lock = threading.Lock()
+    
+    def get(self, clean_face: str) -> np.ndarray:
+        """
+        Decoded image for a base64 cleanFace string (read-only, shared)
+        
+        Args:
+            clean_face: identity_packet["image"]["cleanFace"]
+        
+        Returns:
+            RGB image
+        """
+        
+        key = hashlib.blake2b(clean_face.encode(), digest_size=16).hexdigest()
+        
+        with self._lock:
+            image = self._cache.get(key)
+        
+        if image is None:
+            image = self._decode(base64.b64decode(clean_face))
+            # Shared between requests: catch accidental in-place edits
+            image.flags.writeable = False
+            try:
+                with self._lock:
+                    self._cache[key] = image
+            except ValueError:
+                pass  # Larger than the whole budget
+        
+        return image
+    
+    def clear(self):
+        """Drop all cached images"""
+        
+        with self._lock:
+            self._cache.clear()
+
+
 class DataPurgeProtocol:
     """
     Automatically purge temporary face data after processing
     """
     
+    # Per-session artifacts, named {identity_id}{suffix}
+    SESSION_SUFFIXES = ("_embedding.pkl", "_temp.jpg", "_cache")
+    
     @staticmethod
     def purge_embeddings(temp_dir: str, identity_id: str):
         """
@@ -246,24 +625,22 @@ class DataPurgeProtocol:
         print("🗑️  Purging temporary face data...")
         
         try:
-            # Delete face embeddings
-            embedding_path = os.path.join(temp_dir, f"{identity_id}_embedding.pkl")
-            if os.path.exists(embedding_path):
-                os.remove(embedding_path)
-                print(f"  ✓ Deleted embedding: {embedding_path}")
-            
-            # Delete temporary images
-            temp_image_path = os.path.join(temp_dir, f"{identity_id}_temp.jpg")
-            if os.path.exists(temp_image_path):
-                os.remove(temp_image_path)
-                print(f"  ✓ Deleted temp image: {temp_image_path}")
-            
-            # Delete any cached face detections
-            cache_path = os.path.join(temp_dir, f"{identity_id}_cache")
-            if os.path.exists(cache_path):
-                import shutil
-                shutil.rmtree(cache_path)
-                print(f"  ✓ Deleted cache: {cache_path}")
+            # Embeddings, temp images, cached detections: known names, removed
+            # directly (no directory scan; missing artifacts are skipped)
+            for suffix in DataPurgeProtocol.SESSION_SUFFIXES:
+                path = os.path.join(temp_dir, f"{identity_id}{suffix}")
+                try:
+                    try:
+                        os.unlink(path)
+                    except (IsADirectoryError, PermissionError):
+                        # unlink() on a directory: EISDIR on Linux, EPERM on macOS
+                        if not os.path.isdir(path):
+                            raise
+                        import shutil
+                        shutil.rmtree(path)
+                except FileNotFoundError:
+                    continue
+                print(f"  ✓ Deleted: {path}")
             
             print("✅ Data Purge Complete - Privacy Protected")
             
@@ -285,23 +662,28 @@ class DataPurgeProtocol:
         current_time = time.time()
         max_age_seconds = max_age_hours * 3600
         
-        if not os.path.exists(temp_dir):
-            return
-        
         purged_count = 0
         
-        for filename in os.listdir(temp_dir):
-            filepath = os.path.join(temp_dir, filename)
-            
-            if os.path.isfile(filepath):
-                file_age = current_time - os.path.getmtime(filepath)
+        try:
+            entries = os.scandir(temp_dir)
+        except FileNotFoundError:
+            return
+        
+        # DirEntry carries the file type from readdir, so only old-file
+        # candidates cost a stat() call
+        with entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                
+                file_age = current_time - entry.stat(follow_symlinks=False).st_mtime
                 
                 if file_age > max_age_seconds:
                     try:
-                        os.remove(filepath)
+                        os.unlink(entry.path)
                         purged_count += 1
-                    except Exception as e:
-                        print(f"Could not delete {filepath}: {e}")
+                    except OSError as e:
+                        print(f"Could not delete {entry.path}: {e}")
         
         if purged_count > 0:
             print(f"🗑️  Auto-purged {purged_count} old files from {temp_dir}")